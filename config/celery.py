@@ -35,6 +35,10 @@ app.conf.beat_schedule = {
         "task": "chains.tasks.transact_platform_transactions",
         "schedule": 1,
     },
+    "confirm_blocks": {
+        "task": "chains.tasks.confirm_blocks",
+        "schedule": 2,
+    },
     "refresh_token_prices": {
         "task": "tokens.tasks.refresh_token_prices",
         "schedule": 120,
@@ -312,6 +312,80 @@ REST_FRAMEWORK = {
 # Your stuff...
 # ------------------------------------------------------------------------------
 
+# Chain RPC
+# ------------------------------------------------------------------------------
+# 每个进程内,单个节点地址的 HTTP 长连接池大小
+CHAIN_RPC_POOL_SIZE = env.int("CHAIN_RPC_POOL_SIZE", default=16)
+# 节点达到每秒请求数上限时,单次调用最多等待令牌的秒数,超过则切换节点或交由调用方重试
+CHAIN_RPC_RATE_LIMIT_MAX_WAIT = env.int("CHAIN_RPC_RATE_LIMIT_MAX_WAIT", default=10)
+# 节点连续失败达到此次数后,暂时移出路由
+CHAIN_RPC_EJECT_FAILURES = env.int("CHAIN_RPC_EJECT_FAILURES", default=3)
+# 节点被移出路由的时长(秒)
+CHAIN_RPC_EJECT_SECONDS = env.int("CHAIN_RPC_EJECT_SECONDS", default=30)
+# 读请求的最短对冲延迟(秒);超过最优节点平均延迟的两倍且不短于此值仍未返回,则向次优节点再发一次
+CHAIN_RPC_HEDGE_MIN_DELAY = env.float("CHAIN_RPC_HEDGE_MIN_DELAY", default=0.5)
+# 节点列表在进程内的缓存时长(秒);其它进程对节点的增删、启停与请求数上限的修改,最迟在此时长后生效
+CHAIN_ENDPOINT_POOL_TTL = env.int("CHAIN_ENDPOINT_POOL_TTL", default=30)
+
+# Chain monitoring
+# ------------------------------------------------------------------------------
+# 监控拉取区块时,每个 JSON-RPC 批量请求包含的区块数量;设为 1 则退化为逐个区块请求
+MONITOR_RPC_BATCH_SIZE = env.int("MONITOR_RPC_BATCH_SIZE", default=32)
+# 落后较多时,每个批量请求最多包含的区块数量
+MONITOR_RPC_BATCH_MAX_SIZE = env.int("MONITOR_RPC_BATCH_MAX_SIZE", default=128)
+# 轮询新区块的最短与最长间隔(秒);跟上链头时按半个出块间隔轮询,落后时按最短间隔轮询
+MONITOR_POLL_MIN_INTERVAL = env.float("MONITOR_POLL_MIN_INTERVAL", default=0.2)
+MONITOR_POLL_MAX_INTERVAL = env.float("MONITOR_POLL_MAX_INTERVAL", default=6)
+# 批量请求中失败部分的最大重试次数
+MONITOR_RPC_BATCH_MAX_RETRIES = env.int("MONITOR_RPC_BATCH_MAX_RETRIES", default=3)
+# 数据库落后链上最新区块超过此数量时,启动补齐引擎;少量缺失则直接向上追溯父区块
+MONITOR_BACKFILL_THRESHOLD = env.int("MONITOR_BACKFILL_THRESHOLD", default=8)
+# 补齐引擎每个窗口拉取的区块数量
+MONITOR_BACKFILL_WINDOW = env.int("MONITOR_BACKFILL_WINDOW", default=128)
+# 补齐引擎同时拉取的窗口数量
+MONITOR_BACKFILL_CONCURRENCY = env.int("MONITOR_BACKFILL_CONCURRENCY", default=4)
+# 监控进程内每条链保留的最近区块数量,用于在内存中识别区块重组
+MONITOR_FORK_CHOICE_SIZE = env.int("MONITOR_FORK_CHOICE_SIZE", default=64)
+# 追溯缺失祖先区块的最大深度,超过则认为重组过深,需要人工介入
+MONITOR_MAX_REORG_DEPTH = env.int("MONITOR_MAX_REORG_DEPTH", default=64)
+# WebSocket 订阅超过此秒数没有收到新区块,视为连接失效并退回轮询
+MONITOR_WS_STALE_TIMEOUT = env.int("MONITOR_WS_STALE_TIMEOUT", default=60)
+# 退回轮询后,每隔此秒数重新尝试 WebSocket 订阅
+MONITOR_WS_RETRY_INTERVAL = env.int("MONITOR_WS_RETRY_INTERVAL", default=60)
+# 多个监控实例划分链归属的租约有效期(秒);实例每隔三分之一有效期心跳续期,宕机后由其它实例接管
+MONITOR_LEASE_TTL = env.int("MONITOR_LEASE_TTL", default=10)
+# 监控进程发布的链头区块号的有效期(秒),过期后读取方退回查询数据库或 RPC
+CHAIN_HEAD_TTL = env.int("CHAIN_HEAD_TTL", default=60)
+# 监控进程检查积压程度的 Celery 队列
+MONITOR_BACKPRESSURE_QUEUES = env.list(
+    "MONITOR_BACKPRESSURE_QUEUES",
+    default=["celery"],
+)
+# 队列积压超过高水位时放慢拉取区块;超过临界水位时只跟踪区块头,暂停入库,队列恢复后再补齐
+MONITOR_QUEUE_HIGH_WATERMARK = env.int("MONITOR_QUEUE_HIGH_WATERMARK", default=2000)
+MONITOR_QUEUE_CRITICAL_WATERMARK = env.int(
+    "MONITOR_QUEUE_CRITICAL_WATERMARK",
+    default=10000,
+)
+# 限速时每轮拉取前额外等待的秒数
+MONITOR_THROTTLE_DELAY = env.int("MONITOR_THROTTLE_DELAY", default=2)
+# 事件日志模式下,eth_getLogs 按 indexed to 过滤的最大地址数量;平台地址超过此数量时不按 to 过滤,在本地筛选
+MONITOR_LOGS_TOPICS_PER_CALL = env.int("MONITOR_LOGS_TOPICS_PER_CALL", default=256)
+# 实时跟踪时,链头推进此数量的区块或距上次写入超过此秒数时才写入检查点;
+# 区块数量应小于 MONITOR_FORK_CHOICE_SIZE,否则重启后无法重新投递全部未记入检查点的区块
+MONITOR_CHECKPOINT_BLOCKS = env.int("MONITOR_CHECKPOINT_BLOCKS", default=16)
+MONITOR_CHECKPOINT_INTERVAL = env.int("MONITOR_CHECKPOINT_INTERVAL", default=30)
+# 监控进程内平台地址集合的全量重载间隔(秒),两次重载之间通过变更流增量更新
+MONITOR_WATCHLIST_RELOAD_INTERVAL = env.int(
+    "MONITOR_WATCHLIST_RELOAD_INTERVAL",
+    default=300,
+)
+
+# Block confirmation
+# ------------------------------------------------------------------------------
+# 确认任务每次批量核对的区块数量上限
+CONFIRM_BATCH_SIZE = env.int("CONFIRM_BATCH_SIZE", default=256)
+
 
 from config.settings.unfold.console import UNFOLD as CONSOLE_UNFOLD  # noqa
 from config.settings.unfold.admin import UNFOLD  # noqa
@@ -9,6 +9,7 @@ from web3 import Web3
 from chains.models import Account
 from chains.models import Block
 from chains.models import Chain
+from chains.models import ChainEndpoint
 from chains.models import Transaction
 from chains.models import TransactionQueue
 from common.admin import ModelAdmin
@@ -24,9 +25,14 @@ class ChainForm(forms.ModelForm):
         model = Chain
         fields = (
             "endpoint_uri",
+            "ws_endpoint_uri",
+            "rpc_rate_limit",
             "name",
             "chain_id",
             "block_confirmations_count",
+            "confirmation_mode",
+            "erc20_scan_mode",
+            "mempool_watch",
             "currency",
             "active",
         )
@@ -50,9 +56,16 @@ class ChainForm(forms.ModelForm):
         return endpoint_uri
 
 
+class ChainEndpointInline(TabularInline):
+    model = ChainEndpoint
+    extra = 0
+    fields = ("uri", "weight", "role", "rate_limit", "active")
+
+
 @admin.register(Chain)
 class ChainAdmin(ModelAdmin):
     form = ChainForm
+    inlines = (ChainEndpointInline,)
     readonly_fields = ("name", "chain_id", "currency")
     list_display = (
         "display_header",
@@ -78,6 +91,11 @@ class ChainAdmin(ModelAdmin):
             },
         ]
 
+    def get_inlines(self, request, obj):
+        if obj is None:  # 新建 Chain 时尚未识别出 chain_id,保存后再添加备用节点
+            return ()
+        return self.inlines
+
     def get_fieldsets(self, request, obj=None):
         if obj is None:
             return self.add_fieldsets
@@ -93,12 +111,20 @@ class ChainAdmin(ModelAdmin):
     edit_fieldsets = (
         (
             "节点",
-            {"fields": ("endpoint_uri",)},
+            {"fields": ("endpoint_uri", "ws_endpoint_uri", "rpc_rate_limit")},
         ),
         ("公链信息", {"fields": ("name", "chain_id", "currency")}),
         (
             "配置",
-            {"fields": ("block_confirmations_count", "active")},
+            {
+                "fields": (
+                    "block_confirmations_count",
+                    "confirmation_mode",
+                    "erc20_scan_mode",
+                    "mempool_watch",
+                    "active",
+                ),
+            },
         ),
     )
 
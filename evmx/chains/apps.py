@@ -5,3 +5,6 @@ class ChainsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chains"
     verbose_name = "区块链"
+
+    def ready(self):
+        from chains import watchlist  # noqa: F401
@@ -2,7 +2,13 @@ BASE_TRANSFER_GAS = 21_000
 ERC20_TRANSFER_GAS = 100_000
 DEPLOY_INVOICE_GAS = 160_000
 
+CHAINS_CHANGED_CHANNEL = "chains_changed"
+
 ERC20_TRANSFER_STARTS = "0xa9059cbb"
+# Transfer(address indexed from, address indexed to, uint256 value)
+ERC20_TRANSFER_TOPIC = (
+    "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+)
 
 
 def gas_limit(*, deploy=False, base=True):
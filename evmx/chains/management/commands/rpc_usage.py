@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from chains.utils.ratelimit import rpc_usage
+
+
+class Command(BaseCommand):
+    help = "查看某个小时内各节点各方法的 RPC 调用次数,按次数从多到少排列"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hour",
+            help="UTC 时间的小时,格式 YYYYMMDDHH,默认当前小时",
+        )
+        parser.add_argument("--limit", type=int, default=50, help="最多显示的条数")
+
+    def handle(self, *args, **options):
+        usage = rpc_usage(options["hour"])
+        if not usage:
+            self.stdout.write("没有调用记录")
+            return
+
+        self.stdout.write(f"合计 {sum(usage.values())} 次调用")
+        for field, count in list(usage.items())[: options["limit"]]:
+            self.stdout.write(f"{count:>10}  {field}")
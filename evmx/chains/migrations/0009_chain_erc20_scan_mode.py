@@ -0,0 +1,24 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chains", "0008_alter_chain_block_confirmations_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chain",
+            name="erc20_scan_mode",
+            field=models.CharField(
+                choices=[("input", "交易输入"), ("logs", "事件日志")],
+                default="input",
+                help_text="交易输入: 根据交易调用数据识别 transfer 转账;<br>事件日志: 按区块区间调用 eth_getLogs 识别 Transfer 事件,可识别 transferFrom 与合约内转账,要求节点支持 eth_getLogs;",
+                max_length=8,
+                verbose_name="ERC20 转账识别方式",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chains", "0009_chain_erc20_scan_mode"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chain",
+            name="ws_endpoint_uri",
+            field=models.CharField(
+                blank=True,
+                help_text="选填;填写后监控服务通过 eth_subscribe 订阅新区块,降低出块到入库的延迟;订阅失败时自动退回 HTTP 轮询",
+                max_length=256,
+                verbose_name="WebSocket RPC 节点地址",
+            ),
+        ),
+    ]
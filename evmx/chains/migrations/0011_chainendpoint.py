@@ -0,0 +1,73 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chains", "0010_chain_ws_endpoint_uri"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChainEndpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "uri",
+                    models.CharField(max_length=256, verbose_name="HTTP RPC 节点地址"),
+                ),
+                (
+                    "weight",
+                    models.PositiveSmallIntegerField(
+                        default=1,
+                        help_text="延迟相近时,权重越高的节点越优先;主节点的权重为 1",
+                        verbose_name="权重",
+                    ),
+                ),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[
+                            ("all", "读取与广播"),
+                            ("read", "读取"),
+                            ("broadcast", "广播交易"),
+                        ],
+                        default="all",
+                        max_length=16,
+                        verbose_name="用途",
+                    ),
+                ),
+                ("active", models.BooleanField(default=True, verbose_name="启用")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "chain",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="endpoints",
+                        to="chains.chain",
+                        verbose_name="公链",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "备用节点",
+                "verbose_name_plural": "备用节点",
+                "ordering": ("chain", "-weight"),
+                "unique_together": {("chain", "uri")},
+            },
+        ),
+    ]
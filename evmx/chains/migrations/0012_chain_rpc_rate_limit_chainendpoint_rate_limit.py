@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chains", "0011_chainendpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chain",
+            name="rpc_rate_limit",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="主节点的每秒请求数上限,所有进程共享;0 表示不限制",
+                verbose_name="每秒请求数上限",
+            ),
+        ),
+        migrations.AddField(
+            model_name="chainendpoint",
+            name="rate_limit",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="所有进程共享;0 表示不限制",
+                verbose_name="每秒请求数上限",
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chains", "0012_chain_rpc_rate_limit_chainendpoint_rate_limit"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonitorCheckpoint",
+            fields=[
+                (
+                    "chain",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="monitor_checkpoint",
+                        serialize=False,
+                        to="chains.chain",
+                        verbose_name="公链",
+                    ),
+                ),
+                (
+                    "ingested_number",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="此区块及之前的区块均已入库,且其交易均已投递入库任务",
+                        null=True,
+                        verbose_name="已完整入库的区块号",
+                    ),
+                ),
+                (
+                    "ingested_hash",
+                    models.CharField(
+                        blank=True,
+                        max_length=66,
+                        verbose_name="已完整入库的区块哈希",
+                    ),
+                ),
+                (
+                    "confirmed_number",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        null=True,
+                        verbose_name="已确认的区块号",
+                    ),
+                ),
+                (
+                    "backfill_range",
+                    models.JSONField(
+                        blank=True,
+                        help_text='{"from": 起始区块号, "to": 终止区块号, "done": 已补齐到的区块号}',
+                        null=True,
+                        verbose_name="未完成的补齐区间",
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "监控检查点",
+                "verbose_name_plural": "监控检查点",
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chains", "0013_monitorcheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chain",
+            name="mempool_watch",
+            field=models.BooleanField(
+                default=False,
+                help_text="开启后监控服务监听节点的待打包交易,转入充币地址或账单地址时,向开启了预通知的项目发送未确认的临时通知;<br>待打包交易数量很多,会显著增加节点请求量;最终结果仍以交易入块为准;",
+                verbose_name="监听待打包交易",
+            ),
+        ),
+    ]
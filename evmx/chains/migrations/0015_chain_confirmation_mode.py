@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chains", "0014_chain_mempool_watch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chain",
+            name="confirmation_mode",
+            field=models.CharField(
+                choices=[
+                    ("depth", "确认数"),
+                    ("safe", "safe 区块"),
+                    ("finalized", "finalized 区块"),
+                ],
+                default="depth",
+                help_text="确认数: 区块之上的区块数达到确认数量,且哈希与链上一致时确认;<br>safe / finalized 区块: 由节点报告的 safe / finalized 区块决定,不高于该区块的区块一次全部确认,适用于 PoS 网络及多数 L2,要求节点支持该区块标签;",
+                max_length=16,
+                verbose_name="区块确认方式",
+            ),
+        ),
+    ]
@@ -10,29 +10,44 @@ from django.db import models
 from django.db import transaction as db_transaction
 from django.db.models import F
 from django.db.models import Sum
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from django_redis import get_redis_connection
 from guardian.shortcuts import assign_perm
 from web3 import AsyncWeb3
 from web3 import Web3
+from web3._utils.rpc_abi import RPC
 from web3.auto import w3 as auto_w3
-from web3.datastructures import AttributeDict
 from web3.exceptions import ExtraDataLengthError
 from web3.exceptions import TransactionNotFound
-from web3.middleware import async_geth_poa_middleware
-from web3.middleware import geth_poa_middleware
 from web3.types import ChecksumAddress
 from web3.types import HexStr
 
+from chains.constants import CHAINS_CHANGED_CHANNEL
 from chains.constants import ERC20_TRANSFER_GAS
 from chains.constants import ERC20_TRANSFER_STARTS
 from chains.constants import gas_limit
 from chains.utils import chain_icon_url
 from chains.utils import chain_metadata
-from common.consts import CALCULATE_BLOCK_TIME_COUNT
+from chains.utils.blocktime import read_block_time
+from chains.utils.clients import get_async_w3
+from chains.utils.clients import get_endpoint_pool
+from chains.utils.clients import get_w3
+from chains.utils.clients import invalidate_clients
+from chains.utils.heads import HeadKind
+from chains.utils.heads import read_head
+from chains.utils.logs import topic_to_address
+from chains.utils.logs import transfer_logs
+from chains.utils.rpc import METHOD_NOT_FOUND
+from chains.utils.rpc import batch_request
+from chains.utils.rpc import block_call
+from chains.utils.rpc import format_receipt
+from chains.utils.router import EndpointPool
+from chains.utils.singleflight import single_flight
 from common.decorators import cache_func
 from common.fields import ChecksumAddressField
 from common.fields import HexStr64Field
@@ -49,6 +64,23 @@ from tokens.models import TokenType
 
 
 # Create your models here.
+class ERC20ScanMode(models.TextChoices):
+    Input = "input", "交易输入"
+    Logs = "logs", "事件日志"
+
+
+class ConfirmationMode(models.TextChoices):
+    Depth = "depth", "确认数"
+    Safe = "safe", "safe 区块"
+    Finalized = "finalized", "finalized 区块"
+
+
+class EndpointRole(models.TextChoices):
+    All = "all", "读取与广播"
+    Read = "read", "读取"
+    Broadcast = "broadcast", "广播交易"
+
+
 class Chain(models.Model):
     chain_id = models.PositiveIntegerField(_("Chain ID"), blank=True, primary_key=True)
     name = models.CharField(_("名称"), max_length=32, unique=True, blank=True)
@@ -66,6 +98,18 @@ class Chain(models.Model):
         max_length=256,
         unique=True,
     )
+    ws_endpoint_uri = models.CharField(
+        _("WebSocket RPC 节点地址"),
+        help_text="选填;填写后监控服务通过 eth_subscribe 订阅新区块,降低出块到入库的延迟;"
+        "订阅失败时自动退回 HTTP 轮询",
+        max_length=256,
+        blank=True,
+    )
+    rpc_rate_limit = models.PositiveIntegerField(
+        _("每秒请求数上限"),
+        default=0,
+        help_text="主节点的每秒请求数上限,所有进程共享;0 表示不限制",
+    )
 
     block_confirmations_count = models.PositiveSmallIntegerField(
         verbose_name=_("区块确认数量"),
@@ -75,6 +119,31 @@ class Chain(models.Model):
         "高于此确认数,系统将认定此交易被区块链最终接受;"
         "数值参考:ETH: 12; BSC: 15; Others: 16;",
     )
+    confirmation_mode = models.CharField(
+        _("区块确认方式"),
+        max_length=16,
+        choices=ConfirmationMode.choices,
+        default=ConfirmationMode.Depth,
+        help_text="确认数: 区块之上的区块数达到确认数量,且哈希与链上一致时确认;<br>"
+        "safe / finalized 区块: 由节点报告的 safe / finalized 区块决定,"
+        "不高于该区块的区块一次全部确认,适用于 PoS 网络及多数 L2,要求节点支持该区块标签;",
+    )
+    erc20_scan_mode = models.CharField(
+        _("ERC20 转账识别方式"),
+        max_length=8,
+        choices=ERC20ScanMode.choices,
+        default=ERC20ScanMode.Input,
+        help_text="交易输入: 根据交易调用数据识别 transfer 转账;<br>"
+        "事件日志: 按区块区间调用 eth_getLogs 识别 Transfer 事件,"
+        "可识别 transferFrom 与合约内转账,要求节点支持 eth_getLogs;",
+    )
+    mempool_watch = models.BooleanField(
+        _("监听待打包交易"),
+        default=False,
+        help_text="开启后监控服务监听节点的待打包交易,转入充币地址或账单地址时,"
+        "向开启了预通知的项目发送未确认的临时通知;<br>"
+        "待打包交易数量很多,会显著增加节点请求量;最终结果仍以交易入块为准;",
+    )
     active = models.BooleanField(
         default=True,
         verbose_name=_("启用"),
@@ -93,15 +162,11 @@ class Chain(models.Model):
         return f"{self.name}"
 
     @property
-    @cache_func(timeout=32, use_params=True)
-    def block_mining_time(self):
-        blocks = Block.objects.filter(chain=self).order_by("-number")[
-            :CALCULATE_BLOCK_TIME_COUNT
-        ]
-        if blocks.count() < CALCULATE_BLOCK_TIME_COUNT:
-            return 16
-
-        return (blocks[0].timestamp - blocks[31].timestamp) / CALCULATE_BLOCK_TIME_COUNT
+    def block_mining_time(self) -> float:
+        """
+        平均出块间隔(秒),由监控进程在区块入库时持续估计;
+        """
+        return read_block_time(self.chain_id)
 
     @property
     def is_ready(self):
@@ -113,13 +178,18 @@ class Chain(models.Model):
 
     @property
     def gas_price(self) -> int:
-        return self.w3.eth.gas_price
+        return single_flight(
+            self.chain_id,
+            RPC.eth_gasPrice,
+            lambda: self.w3.eth.gas_price,
+        )
 
     @property
     def erc20_transfer_cost(self):
         return ERC20_TRANSFER_GAS * self.gas_price
 
     def is_contract(self, address: ChecksumAddress):
+        # 用于提币地址校验,不合并也不缓存,刚部署的合约也要能识别出来
         return self.w3.eth.get_code(address).hex() != "0x"
 
     def get_balance(self, address: ChecksumAddress) -> int:
@@ -128,6 +198,62 @@ class Chain(models.Model):
     def get_transaction_receipt(self, tx_hash: HexStr) -> dict:
         return json.loads(Web3.to_json(self.w3.eth.get_transaction_receipt(tx_hash)))
 
+    def get_transaction_receipts(self, tx_hashes: list[HexStr]) -> dict[HexStr, dict]:
+        """
+        通过 JSON-RPC 批量请求一次性获取多笔交易的回执;
+        :return: {交易哈希: 回执}
+        """
+        raw_receipts = batch_request(
+            self.endpoint_pool.read_uris(),
+            [(RPC.eth_getTransactionReceipt, [tx_hash]) for tx_hash in tx_hashes],
+        )
+        return {
+            tx_hash: format_receipt(raw_receipt)
+            for tx_hash, raw_receipt in zip(tx_hashes, raw_receipts, strict=True)
+        }
+
+    @property
+    def supports_block_receipts(self) -> bool:
+        return not cache.get(f"block_receipts_unsupported_{self.chain_id}", False)
+
+    def get_block_receipts(
+        self,
+        block_hash: HexStr,
+        tx_hashes: list[HexStr],
+    ) -> dict[HexStr, dict]:
+        """
+        获取同一区块中多笔交易的回执,每笔交易的回执只请求一次;
+        节点支持 eth_getBlockReceipts 时一次取回整个区块的回执,否则退化为按交易哈希批量请求;
+        只有一笔交易时,单独请求回执比取回整个区块更省;
+        :return: {交易哈希: 回执}
+        """
+        receipts = {}
+        wanted_hashes = set(tx_hashes)
+        if len(wanted_hashes) > 1 and self.supports_block_receipts:
+            response = self.w3.provider.make_request(
+                "eth_getBlockReceipts",
+                [block_hash],
+            )
+            if "error" in response:
+                if response["error"].get("code") == METHOD_NOT_FOUND:
+                    cache.set(
+                        f"block_receipts_unsupported_{self.chain_id}",
+                        value=True,
+                        timeout=3600,
+                    )
+            else:
+                receipts = {
+                    raw_receipt["transactionHash"]: format_receipt(raw_receipt)
+                    for raw_receipt in response["result"] or []
+                    if raw_receipt["transactionHash"] in wanted_hashes
+                }
+
+        missing_hashes = [tx_hash for tx_hash in tx_hashes if tx_hash not in receipts]
+        if missing_hashes:
+            receipts.update(self.get_transaction_receipts(missing_hashes))
+
+        return receipts
+
     def get_transaction(self, tx_hash: HexStr) -> dict:
         return json.loads(Web3.to_json(self.w3.eth.get_transaction(tx_hash)))
 
@@ -135,12 +261,23 @@ class Chain(models.Model):
         return json.loads(Web3.to_json(self.w3.eth.get_block(block_number)))
 
     def get_block_number(self) -> int:
-        return self.w3.eth.get_block_number()
+        return single_flight(
+            self.chain_id,
+            RPC.eth_blockNumber,
+            self.w3.eth.get_block_number,
+        )
 
     def is_block_number_confirmed(self, block_number):
-        return block_number + self.block_confirmations_count < self.get_block_number()
+        if self.confirmation_mode != ConfirmationMode.Depth:
+            return block_number <= self.finality_number
 
-    def is_transaction_should_be_processed(self, tx: dict) -> bool:
+        return block_number + self.block_confirmations_count < self.head_number
+
+    def is_transaction_should_be_processed(
+        self,
+        tx: dict,
+        receipt: dict | None = None,
+    ) -> bool:
         if (
             tx["input"].startswith(ERC20_TRANSFER_STARTS)
             and TokenAddress.objects.filter(
@@ -151,6 +288,11 @@ class Chain(models.Model):
         ):  # 平台所支持的 ERC20 代币的转账 (transfer)
             return True
 
+        if receipt and self.has_platform_token_transfer(
+            receipt,
+        ):  # 回执中有转入平台地址的 ERC20 Transfer 事件 (transferFrom、合约内转账)
+            return True
+
         if Invoice.objects.filter(
             pay_address=tx["to"],
             transaction_queue__transaction__isnull=True,
@@ -166,6 +308,34 @@ class Chain(models.Model):
             address=tx["to"],
         ).exists()  # 转入 ETH 到平台内部账户
 
+    def has_platform_token_transfer(self, receipt: dict) -> bool:
+        logs = transfer_logs(receipt)
+        if not logs:
+            return False
+
+        token_addresses = set(
+            TokenAddress.objects.filter(
+                chain=self,
+                address__in={log["address"] for log in logs},
+                token__type=TokenType.ERC20,
+            ).values_list("address", flat=True),
+        )
+        to_addresses = {
+            topic_to_address(log["topics"][2])
+            for log in logs
+            if log["address"] in token_addresses
+        }
+        if not to_addresses:
+            return False
+
+        return (
+            Account.objects.filter(address__in=to_addresses).exists()
+            or Invoice.objects.filter(
+                pay_address__in=to_addresses,
+                transaction_queue__transaction__isnull=True,
+            ).exists()
+        )
+
     def is_transaction_packed(self, tx_hash: HexStr) -> bool:
         try:
             self.get_transaction_receipt(tx_hash)
@@ -178,24 +348,48 @@ class Chain(models.Model):
         receipt = self.get_transaction_receipt(tx_hash)
         return self.is_block_number_confirmed(receipt["blockNumber"])
 
+    def get_block_hashes(self, block_numbers: list[int]) -> dict[int, HexStr]:
+        """
+        只请求区块头(不含交易体),批量获取多个区块号在链上的当前哈希;
+        :return: {区块号: 哈希}
+        """
+        raw_blocks = batch_request(
+            self.endpoint_pool.read_uris(),
+            [
+                block_call(block_number, full_transactions=False)
+                for block_number in block_numbers
+            ],
+        )
+        return {
+            block_number: raw_block["hash"]
+            for block_number, raw_block in zip(block_numbers, raw_blocks, strict=True)
+        }
+
+    def get_tagged_block(self, tag: str) -> tuple[int, HexStr]:
+        """
+        只请求区块头,获取节点报告的 safe / finalized 区块;
+        :return: (区块号, 哈希)
+        """
+        [raw_block] = batch_request(
+            self.endpoint_pool.read_uris(),
+            [block_call(tag, full_transactions=False)],
+        )
+        return int(raw_block["number"], 16), raw_block["hash"]
+
     def is_block_confirmed(self, block_number: int, block_hash: HexStr) -> bool:
-        return self.get_block(block_number)["hash"] == block_hash
+        return self.get_block_hashes([block_number])[block_number] == block_hash
 
     @property
-    def w3(self):
-        w3 = Web3(Web3.HTTPProvider(self.endpoint_uri))
-        if self.is_poa:
-            w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
-        return w3
+    def endpoint_pool(self) -> EndpointPool:
+        return get_endpoint_pool(self)
 
     @property
-    def async_w3(self):
-        aw3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(self.endpoint_uri))
-        if self.is_poa:
-            aw3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+    def w3(self) -> Web3:
+        return get_w3(self)
 
-        return aw3
+    @property
+    def async_w3(self) -> AsyncWeb3:
+        return get_async_w3(self)
 
     @property
     def get_is_poa(self) -> bool:
@@ -212,30 +406,65 @@ class Chain(models.Model):
     def max_block_in_db(self) -> int:
         return Block.objects.filter(chain=self).order_by("-number").first().number
 
+    @property
+    def head_number(self) -> int:
+        """
+        链上最新区块号,优先读取监控进程发布的值,过期后才发起 RPC 请求;
+        """
+        number = read_head(self.chain_id, HeadKind.Chain)
+        return self.get_block_number() if number is None else number
+
+    @property
+    def db_head_number(self) -> int:
+        """
+        数据库中的最新区块号,优先读取监控进程发布的值,过期后才查询数据库;
+        """
+        number = read_head(self.chain_id, HeadKind.Db)
+        return self.max_block_in_db if number is None else number
+
+    @property
+    def finality_number(self) -> int:
+        """
+        节点报告的 safe / finalized 区块号,优先读取确认任务发布的值,过期后才发起 RPC 请求;
+        """
+        number = read_head(self.chain_id, HeadKind.Finality)
+        if number is None:
+            number, _ = self.get_tagged_block(self.confirmation_mode)
+        return number
+
+    @property
+    def confirmations_required(self) -> int:
+        """
+        确认一个区块需要的区块数;
+        safe / finalized 模式下取数据库最新区块与最终区块的距离,仅用于估算确认进度;
+        """
+        if self.confirmation_mode == ConfirmationMode.Depth:
+            return self.block_confirmations_count
+
+        return max(self.db_head_number - self.finality_number, 1)
+
     @property
     async def amax_block_in_db(self) -> int | None:
         max_block = await Block.objects.filter(chain=self).order_by("-number").afirst()
         return max_block.number if max_block else None
 
-    async def need_aligned(
-        self,
-        block_datas: list[AttributeDict],
-    ) -> tuple[bool, int, int]:
-        if not block_datas:
-            return False, 0, 0
-
-        current_number = block_datas[0]["number"]
-        max_block_in_db = await self.amax_block_in_db
 
-        if max_block_in_db and current_number > max_block_in_db + 31:
-            return True, max_block_in_db + 1, max_block_in_db + 32
+def publish_chain_changed(chain_id: int):
+    invalidate_clients(chain_id)
 
-        return False, 0, 0
+    # 事务提交后再通知监控服务,只重启发生变更的链的监控任务
+    db_transaction.on_commit(
+        lambda: get_redis_connection("default").publish(
+            CHAINS_CHANGED_CHANNEL,
+            chain_id,
+        ),
+    )
 
 
 @receiver(post_save, sender=Chain)
-def chains_changed(*args, **kwargs):
-    cache.set(key="chains_changed", value=True)
+@receiver(post_delete, sender=Chain)
+def chains_changed(sender, instance: Chain, **kwargs):
+    publish_chain_changed(instance.chain_id)
 
 
 @receiver(pre_save, sender=Chain)
@@ -275,6 +504,94 @@ def chain_fill_up(sender, instance: Chain, **kwargs):
         )
 
 
+class ChainEndpoint(models.Model):
+    chain = models.ForeignKey(
+        "chains.Chain",
+        on_delete=models.CASCADE,
+        related_name="endpoints",
+        verbose_name="公链",
+    )
+    uri = models.CharField(_("HTTP RPC 节点地址"), max_length=256)
+    weight = models.PositiveSmallIntegerField(
+        _("权重"),
+        default=1,
+        help_text="延迟相近时,权重越高的节点越优先;主节点的权重为 1",
+    )
+    role = models.CharField(
+        _("用途"),
+        max_length=16,
+        choices=EndpointRole.choices,
+        default=EndpointRole.All,
+    )
+    rate_limit = models.PositiveIntegerField(
+        _("每秒请求数上限"),
+        default=0,
+        help_text="所有进程共享;0 表示不限制",
+    )
+    active = models.BooleanField(default=True, verbose_name=_("启用"))
+
+    created_at = models.DateTimeField(_("创建时间"), auto_now_add=True)
+
+    class Meta:
+        ordering = ("chain", "-weight")
+        unique_together = (
+            "chain",
+            "uri",
+        )
+        verbose_name = _("备用节点")
+        verbose_name_plural = _("备用节点")
+
+    def __str__(self):
+        return self.uri
+
+
+@receiver(post_save, sender=ChainEndpoint)
+@receiver(post_delete, sender=ChainEndpoint)
+def chain_endpoints_changed(sender, instance: ChainEndpoint, **kwargs):
+    publish_chain_changed(instance.chain_id)
+
+
+class MonitorCheckpoint(models.Model):
+    chain = models.OneToOneField(
+        "chains.Chain",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="monitor_checkpoint",
+        verbose_name="公链",
+    )
+    ingested_number = models.PositiveIntegerField(
+        _("已完整入库的区块号"),
+        help_text="此区块及之前的区块均已入库,且其交易均已投递入库任务",
+        null=True,
+        blank=True,
+    )
+    ingested_hash = models.CharField(
+        _("已完整入库的区块哈希"),
+        max_length=66,
+        blank=True,
+    )
+    confirmed_number = models.PositiveIntegerField(
+        _("已确认的区块号"),
+        null=True,
+        blank=True,
+    )
+    backfill_range = models.JSONField(
+        _("未完成的补齐区间"),
+        help_text='{"from": 起始区块号, "to": 终止区块号, "done": 已补齐到的区块号}',
+        null=True,
+        blank=True,
+    )
+
+    updated_at = models.DateTimeField(_("更新时间"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("监控检查点")
+        verbose_name_plural = _("监控检查点")
+
+    def __str__(self):
+        return f"{self.chain.name}-{self.ingested_number}"
+
+
 class Block(models.Model):
     hash = HexStr64Field(verbose_name="哈希值")
     parent = models.OneToOneField(
@@ -322,8 +639,8 @@ class Block(models.Model):
         return (
             min(
                 (
-                    (self.chain.max_block_in_db - self.number)
-                    / self.chain.block_confirmations_count
+                    (self.chain.db_head_number - self.number)
+                    / self.chain.confirmations_required
                 ),
                 1,
             )
@@ -334,10 +651,7 @@ class Block(models.Model):
         if self.confirmed:
             return True
 
-        if (
-            self.number + self.chain.block_confirmations_count
-            > self.chain.max_block_in_db
-        ):
+        if self.number + self.chain.confirmations_required > self.chain.db_head_number:
             return False
 
         if self.chain.is_block_confirmed(
@@ -358,7 +672,7 @@ class Block(models.Model):
 @receiver(pre_save, sender=Block)
 def check_parent_block(sender, instance: Block, **kwargs):
     # 只需要创建区块时候进行验证
-    if Block.objects.filter(pk=instance.pk).exists():
+    if not instance._state.adding:  # noqa: SLF001
         return
 
     if instance.parent:
@@ -374,19 +688,6 @@ def check_parent_block(sender, instance: Block, **kwargs):
         raise ValidationError(msg)
 
 
-@receiver(post_save, sender=Block)
-def block_created(sender, instance, created, **kwargs):
-    if created:
-        from chains.tasks import confirm_the_block
-
-        confirm_the_block.apply_async(
-            (instance.pk,),
-            countdown=instance.chain.block_confirmations_count
-            * instance.chain.block_mining_time
-            + 4,
-        )
-
-
 class TxType(models.TextChoices):
     Paying = "paying", "💳 支付账单"
     Depositing = "depositing", "💰 充币"
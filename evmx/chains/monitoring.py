@@ -2,13 +2,23 @@ import asyncio
 import json
 import os
 import sys
+import time
+from collections import deque
 from pathlib import Path
 
 import django
-from django.core.cache import cache
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction as db_transaction
 from loguru import logger
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from web3 import Web3
+from web3._utils.rpc_abi import RPC
 from web3.datastructures import AttributeDict
 from web3.types import HexStr
+from websockets import connect as ws_connect
+from websockets.exceptions import WebSocketException
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(BASE_DIR))
@@ -16,9 +26,39 @@ sys.path.append(str(BASE_DIR))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
 django.setup()
 
+from chains.constants import CHAINS_CHANGED_CHANNEL
 from chains.models import Block
 from chains.models import Chain
-from chains.tasks import filter_and_store_tx
+from chains.models import ERC20ScanMode
+from chains.models import MonitorCheckpoint
+from chains.tasks import ingest_block
+from chains.tasks import notify_pending_transaction
+from chains.utils.backpressure import PRESSURE_LABELS
+from chains.utils.backpressure import Backpressure
+from chains.utils.backpressure import Pressure
+from chains.utils.bloom import may_have_transfer
+from chains.utils.blocktime import local_block_time
+from chains.utils.blocktime import aobserve_block_interval
+from chains.utils.clients import get_endpoint_pool
+from chains.utils.clients import invalidate_clients
+from chains.utils.forkchoice import BlockRef
+from chains.utils.forkchoice import ForkChoice
+from chains.utils.forkchoice import ReorgDepthExceededError
+from chains.utils.heads import HeadKind
+from chains.utils.heads import apublish_head
+from chains.utils.leases import ChainLeases
+from chains.utils.logs import address_to_topic
+from chains.utils.logs import transfer_logs
+from chains.utils.logs import transfer_logs_call
+from chains.utils.polling import fetch_batch_size
+from chains.utils.polling import poll_interval
+from chains.utils.ratelimit import RPCPriority
+from chains.utils.ratelimit import set_rpc_priority
+from chains.utils.rpc import async_batch_request
+from chains.utils.rpc import block_call
+from chains.utils.rpc import format_block
+from chains.utils.rpc import format_transaction
+from chains.watchlist import watched_addresses
 
 
 async def get_block_data(chain: Chain, block_identifier: HexStr | int) -> AttributeDict:
@@ -30,143 +70,1047 @@ async def get_block_data_batch(
     block_identifiers: list[HexStr | int],
 ) -> list[AttributeDict]:
     """
-    通过协程,异步获取批量区块数据
+    批量获取区块数据;
+    批量大小大于 1 时,将区块打包为 JSON-RPC 批量请求,否则逐个区块通过协程并发获取;
+    批量大小随待拉取的区块数量调整,落后越多每个批量请求包含的区块越多;
     :param chain:
     :param block_identifiers:
-    :return:
+    :return: 按区块号从小到大排序的区块数据
     """
-    get_block_data_tasks = [
-        get_block_data(chain, block_identifier)
-        for block_identifier in block_identifiers
-    ]
-    block_datas = await asyncio.gather(*get_block_data_tasks)
+    if not block_identifiers:
+        return []
+
+    batch_size = fetch_batch_size(len(block_identifiers))
+    if batch_size > 1:
+        raw_blocks = await async_batch_request(
+            chain.endpoint_pool.read_uris(),
+            [block_call(block_identifier) for block_identifier in block_identifiers],
+            batch_size=batch_size,
+        )
+        block_datas = [
+            format_block(raw_block, is_poa=chain.is_poa) for raw_block in raw_blocks
+        ]
+    else:
+        get_block_data_tasks = [
+            get_block_data(chain, block_identifier)
+            for block_identifier in block_identifiers
+        ]
+        block_datas = await asyncio.gather(*get_block_data_tasks)
 
     # 对区块数据按照区块号进行排序
 
     return sorted(block_datas, key=lambda x: x["number"])
 
 
-async def get_parent_block(chain: Chain, parent_hash: HexStr) -> Block | None:
+async def get_header_number(chain: Chain, block_hash: HexStr | bytes) -> int:
     """
-    只有缺失数量不多的情况下,才会进入此追溯父块的函数,因为此函数会发生递归调用,需控制深度;
-    根据父区块的哈希值获取数据库对应的 Block,若不存在,则创建父区块;
-    :param chain: 区块网络
-    :param parent_hash: 父块哈希值
-    :return: 父 Block;如果是新系统干净无区块,则返回 None
+    只请求区块头,获取区块号;
     """
-    try:
-        return await Block.objects.aget(hash=parent_hash)
+    [raw_header] = await async_batch_request(
+        chain.endpoint_pool.read_uris(),
+        [block_call(block_hash, full_transactions=False)],
+    )
+    return int(raw_header["number"], 16)
+
+
+async def get_transfer_tx_hashes(
+    chain: Chain,
+    block_datas: list[AttributeDict],
+) -> set[HexStr]:
+    """
+    事件日志模式下,按区块区间调用 eth_getLogs,找出向平台地址转入所支持 ERC20 代币的交易;
+    先用区块头的 logsBloom 排除不可能包含此类事件的区块,只查询剩余区块所在的区间;
+    :return: 交易哈希集合
+    """
+    token_addresses = sorted(watched_addresses.tokens[chain.chain_id])
+    to_addresses = watched_addresses.platform_addresses(chain.chain_id)
+    if not token_addresses or not to_addresses:
+        return set()
+
+    token_masks, to_masks = watched_addresses.transfer_masks(chain.chain_id)
+    candidate_numbers = [
+        block_data["number"]
+        for block_data in block_datas
+        if may_have_transfer(block_data["logsBloom"], token_masks, to_masks)
+    ]
+    if not candidate_numbers:
+        return set()
+
+    [logs] = await async_batch_request(
+        chain.endpoint_pool.read_uris(),
+        [
+            transfer_logs_call(
+                min(candidate_numbers),
+                max(candidate_numbers),
+                token_addresses,
+                to_addresses,
+            ),
+        ],
+    )
+    # 平台地址较多时 eth_getLogs 不按 to 过滤,在本地筛选转入平台地址的事件
+    to_topics = {address_to_topic(address) for address in to_addresses}
+    return {
+        log["transactionHash"]
+        for log in transfer_logs({"logs": logs})
+        if not log.get("removed") and log["topics"][2].lower() in to_topics
+    }
+
+
+async def find_missing_ancestors(
+    chain: Chain,
+    parent_hash: HexStr,
+    number: int,
+) -> tuple[Block, list[AttributeDict]]:
+    """
+    从父区块开始,沿哈希向前迭代追溯,直到找到数据库中已存在的共同祖先;
+    每次按区块号批量拉取一组祖先,并逐个校验哈希链接,节点恰好在此期间重组时改为按哈希单独拉取;
+    追溯深度超过 MONITOR_MAX_REORG_DEPTH 时抛出 ReorgDepthExceededError;
+    :param chain:
+    :param parent_hash: 新区块的父区块哈希
+    :param number: 新区块的区块号
+    :return: (共同祖先 Block, 从旧到新排列的缺失祖先区块数据)
+    """
+    max_depth = settings.MONITOR_MAX_REORG_DEPTH
+    segment: list[AttributeDict] = []
+    expected_hash, to_number = parent_hash, number - 1
+
+    while to_number >= 0:
+        from_number = max(to_number - settings.MONITOR_RPC_BATCH_SIZE + 1, 0)
+        stored_blocks = {
+            block.number: block
+            async for block in Block.objects.filter(
+                chain=chain,
+                number__range=(from_number, to_number),
+            )
+        }
+        fetched_blocks = None
+
+        for current_number in range(to_number, from_number - 1, -1):
+            stored_block = stored_blocks.get(current_number)
+            if stored_block and stored_block.hash == expected_hash:
+                return stored_block, segment[::-1]
+
+            if len(segment) >= max_depth:
+                msg = f"{chain.name} 在 {number} 之前追溯超过 {max_depth} 个区块仍未找到共同祖先"
+                raise ReorgDepthExceededError(msg)
+
+            if fetched_blocks is None:
+                fetched_blocks = {
+                    block_data["number"]: block_data
+                    for block_data in await get_block_data_batch(
+                        chain,
+                        list(range(from_number, current_number + 1)),
+                    )
+                }
+
+            block_data = fetched_blocks.get(current_number)
+            if block_data is None or block_data["hash"].hex() != expected_hash:
+                block_data = await get_block_data(chain, expected_hash)
+
+            segment.append(block_data)
+            expected_hash = block_data["parentHash"].hex()
+
+        to_number = from_number - 1
+
+    msg = f"{chain.name} 追溯到创世区块仍未找到共同祖先"
+    raise ReorgDepthExceededError(msg)
 
-    except Block.DoesNotExist:
-        if await chain.block_set.aexists():
-            parent_data = await get_block_data(chain, parent_hash)
-            return await store_block_with_txs(chain, parent_data)
 
+@sync_to_async
+def store_block_segment(
+    chain: Chain,
+    ancestor: Block,
+    block_datas: list[AttributeDict],
+) -> list[Block]:
+    """
+    在一个数据库事务中删除共同祖先之后的孤块,并按顺序插入追溯到的祖先区块;
+    """
+    blocks = []
+    with db_transaction.atomic():
+        Block.objects.filter(chain=chain, number__gt=ancestor.number).delete()
+
+        parent = ancestor
+        for block_data in block_datas:
+            parent = Block.objects.create(
+                hash=block_data["hash"].hex(),
+                parent=parent,
+                number=block_data["number"],
+                chain=chain,
+                timestamp=block_data["timestamp"],
+            )
+            blocks.append(parent)
+
+    return blocks
+
+
+async def reconcile_parent_block(
+    chain: Chain,
+    block_data: AttributeDict,
+    fork_choice: ForkChoice,
+) -> Block | None:
+    """
+    环形缓冲中找不到父区块时(刚启动、少量缺块或深度重组),迭代补齐缺失的祖先区块;
+    :return: 新区块的父 Block;如果是新系统干净无区块,则返回 None
+    """
+    fork_choice.clear()
+    if not await chain.block_set.aexists():
         return None
 
+    ancestor, segment = await find_missing_ancestors(
+        chain,
+        block_data["parentHash"].hex(),
+        block_data["number"],
+    )
+    blocks = await store_block_segment(chain, ancestor, segment)
+    if segment:
+        logger.warning(
+            f"{chain.name} 补齐了 {ancestor.number} 之后的 {len(segment)} 个祖先区块",
+        )
+
+    fork_choice.push(BlockRef(ancestor.number, ancestor.hash, None, ancestor))
+    for block, segment_block_data in zip(blocks, segment, strict=True):
+        fork_choice.push(
+            BlockRef(
+                block.number,
+                block.hash,
+                segment_block_data["parentHash"].hex(),
+                block,
+            ),
+        )
+
+    transfer_tx_hashes = None
+    if segment and chain.erc20_scan_mode == ERC20ScanMode.Logs:
+        transfer_tx_hashes = await get_transfer_tx_hashes(chain, segment)
+    for segment_block_data in segment:
+        dispatch_block_txs(chain, segment_block_data, transfer_tx_hashes)
+
+    return fork_choice.head.block
+
+
+def dispatch_block_txs(
+    chain: Chain,
+    block_data: AttributeDict,
+    transfer_tx_hashes: set[HexStr] | None,
+):
+    """
+    粗筛区块中与平台相关的交易,投递一个区块入库任务;
+    调用数据模式下,logsBloom 表明区块中没有转入平台地址的 Transfer 事件时,不再按调用数据识别 ERC20 转账;
+    """
+    scan_by_logs = chain.erc20_scan_mode == ERC20ScanMode.Logs
+    by_input = not scan_by_logs and may_have_transfer(
+        block_data["logsBloom"],
+        *watched_addresses.transfer_masks(chain.chain_id),
+    )
+    candidate_txs = [
+        json.loads(chain.w3.to_json(tx))
+        for tx in block_data["transactions"]
+        if watched_addresses.match(
+            chain.chain_id,
+            tx,
+            by_input=by_input,
+        )  # 与平台无关的交易,不投递任务
+        or (scan_by_logs and Web3.to_hex(tx["hash"]) in transfer_tx_hashes)
+    ]
+    if candidate_txs:
+        ingest_block.delay(chain.chain_id, block_data["number"], candidate_txs)
+
+
+async def load_fork_choice(
+    chain: Chain,
+    fork_choice: ForkChoice | None = None,
+) -> ForkChoice:
+    """
+    用数据库中最近的区块初始化环形缓冲,监控重启后第一个区块即可直接在内存中比对;
+    :param fork_choice: 传入时原地重新载入,持有同一个缓冲的补齐任务随之更新
+    """
+    if fork_choice is None:
+        fork_choice = ForkChoice(settings.MONITOR_FORK_CHOICE_SIZE)
+    fork_choice.clear()
+    blocks = [
+        block
+        async for block in Block.objects.filter(chain=chain).order_by("-number")[
+            : settings.MONITOR_FORK_CHOICE_SIZE
+        ]
+    ]
+    for block in reversed(blocks):
+        fork_choice.push(BlockRef(block.number, block.hash, None, block))
+
+    return fork_choice
+
 
-async def store_block_with_txs(chain: Chain, block_data: AttributeDict) -> Block:
+async def store_block_with_txs(
+    chain: Chain,
+    block_data: AttributeDict,
+    fork_choice: ForkChoice,
+    transfer_tx_hashes: set[HexStr] | None = None,
+) -> Block:
     """
     将本区块和它的交易入库;
+    新区块延续当前链头时只需一次 INSERT;
+    父区块在环形缓冲中但不是链头,说明发生了重组,只删除分叉后的孤块;
+    缓冲中找不到父区块时,才迭代追溯并补齐缺失的祖先区块;
     :param block_data:
     :param chain:
+    :param fork_choice: 本链最近区块的环形缓冲
+    :param transfer_tx_hashes: 事件日志模式下,已通过 eth_getLogs 识别出的 ERC20 转账交易哈希
     :return: Block
     """
-    await Block.objects.filter(
-        chain=chain,
-        number__gte=block_data["number"],
-    ).adelete()  # 删除同网络中所有大于等于本区块号的区块
-    parent_block = await get_parent_block(chain, block_data["parentHash"].hex())
+    block_hash = block_data["hash"].hex()
+    parent_hash = block_data["parentHash"].hex()
+
+    stored = fork_choice.find(block_hash)
+    if stored:  # 已入库,实时跟踪与补齐的区块可能重叠
+        return stored.block
+
+    scan_by_logs = chain.erc20_scan_mode == ERC20ScanMode.Logs
+    if scan_by_logs and transfer_tx_hashes is None:
+        transfer_tx_hashes = await get_transfer_tx_hashes(chain, [block_data])
+
+    if fork_choice.extends_head(block_data["number"], parent_hash):
+        parent_block = fork_choice.head.block
+
+    elif ancestor := fork_choice.find(parent_hash):
+        logger.warning(
+            f"{chain.name} 发生区块重组,回退到 {ancestor.number} {ancestor.hash}",
+        )
+        await Block.objects.filter(
+            chain=chain,
+            number__gt=ancestor.number,
+        ).adelete()  # 只删除分叉后的孤块
+        fork_choice.rewind_to(ancestor.number)
+        await save_checkpoint(chain, fork_choice)  # 检查点可能指向孤块,立即回退
+        parent_block = ancestor.block
+
+    else:
+        parent_block = await reconcile_parent_block(chain, block_data, fork_choice)
 
     block_obj: Block = await Block.objects.acreate(
-        hash=block_data["hash"].hex(),
+        hash=block_hash,
         parent=parent_block,
         number=block_data["number"],
         chain=chain,
         timestamp=block_data["timestamp"],
     )
-
-    for tx in block_data["transactions"]:
-        filter_and_store_tx.delay(
+    fork_choice.push(
+        BlockRef(block_obj.number, block_obj.hash, parent_hash, block_obj),
+    )
+    await apublish_head(chain.chain_id, HeadKind.Db, block_obj.number)
+    if parent_block:
+        await aobserve_block_interval(
             chain.chain_id,
-            block_obj.number,
-            json.loads(chain.w3.to_json(tx)),
+            block_obj.timestamp - parent_block.timestamp,
         )
 
-    logger.info(f"{block_data['number']}  {block_data['hash'].hex()} ok")
+    dispatch_block_txs(chain, block_data, transfer_tx_hashes)
+
+    logger.info(f"{block_data['number']}  {block_hash} ok")
 
     return block_obj
 
 
-async def monitor_the_chain(chain: Chain):
+# 记录每条链最近一次写入检查点时的链头区块号与时间
+_last_checkpoints: dict[int, tuple[int, float]] = {}
+
+
+async def save_checkpoint(chain: Chain, fork_choice: ForkChoice, **fields):
     """
-    监控区块链网络;
-    当数据库中的 Chain 数据发生变化时,结束本次监控任务;
-    监控过程中,需要判断数据库的最新区块,是否大幅落后于区块链,如果是的话,需要运行区块补齐逻辑,未落后则将当前最新区块入库;
-    :param chain:
-    :return: None
+    把当前链头记为已完整入库(区块已入库,交易已投递)并写入检查点,同时更新 fields 中的其它字段;
     """
-    while True:
-        if cache.get("chains_changed", False):
-            logger.info(f"检测到链发生数据变更,重启{chain.name}监控")
-            return
+    if fork_choice.head:
+        fields.update(
+            ingested_number=fork_choice.head.number,
+            ingested_hash=fork_choice.head.hash,
+        )
+
+    await MonitorCheckpoint.objects.aupdate_or_create(chain=chain, defaults=fields)
+    if fork_choice.head:
+        _last_checkpoints[chain.chain_id] = (fork_choice.head.number, time.monotonic())
+
+
+async def save_head_checkpoint(chain: Chain, fork_choice: ForkChoice):
+    """
+    实时跟踪时不必每批区块都写检查点,以免稳定状态下每个区块多出一次查询与更新;
+    链头距上次写入推进了 MONITOR_CHECKPOINT_BLOCKS 个区块,或超过 MONITOR_CHECKPOINT_INTERVAL 秒时才写入;
+    期间未记入检查点的区块,重启后由 resume_from_checkpoint 重新投递;
+    """
+    if fork_choice.head is None:
+        return
+
+    last = _last_checkpoints.get(chain.chain_id)
+    if (
+        last
+        and fork_choice.head.number - last[0] < settings.MONITOR_CHECKPOINT_BLOCKS
+        and time.monotonic() - last[1] < settings.MONITOR_CHECKPOINT_INTERVAL
+    ):
+        return
+
+    await save_checkpoint(chain, fork_choice)
+
+
+async def resume_from_checkpoint(
+    chain: Chain,
+    fork_choice: ForkChoice,
+    backfiller: "BlockBackfiller",
+):
+    """
+    监控重启后从检查点恢复:
+    检查点之后已入库的区块,可能在投递交易前退出,重新投递一次(入库任务会跳过已入库的交易);
+    上次未完成的补齐区间,从数据库的最新区块继续补齐;
+    """
+    # 冷启动时平台地址集合为空,必须先载入,否则重新投递与补齐的区块中的交易都会被过滤掉
+    await watched_addresses.arefresh()
+    checkpoint = await MonitorCheckpoint.objects.filter(chain=chain).afirst()
+    if checkpoint is None or fork_choice.head is None:
+        return
+
+    head_number = fork_choice.head.number
+    if (
+        checkpoint.ingested_number is not None
+        and head_number > checkpoint.ingested_number
+    ):
+        from_number = max(
+            checkpoint.ingested_number + 1,
+            head_number - len(fork_choice) + 1,
+        )
+        block_datas = await get_block_data_batch(
+            chain,
+            list(range(from_number, head_number + 1)),
+        )
+        transfer_tx_hashes = None
+        if chain.erc20_scan_mode == ERC20ScanMode.Logs:
+            transfer_tx_hashes = await get_transfer_tx_hashes(chain, block_datas)
+
+        for block_data in block_datas:
+            # 已被重组的区块交给实时跟踪处理
+            if fork_choice.find(block_data["hash"].hex()):
+                dispatch_block_txs(chain, block_data, transfer_tx_hashes)
+
+        logger.info(f"{chain.name} 重新投递区块 {from_number} - {head_number} 的交易")
+        await save_checkpoint(chain, fork_choice)
+
+    backfill_range = checkpoint.backfill_range
+    if backfill_range and head_number < backfill_range["to"]:
+        backfiller.start(head_number + 1, backfill_range["to"])
+
+
+class BlockBackfiller:
+    """
+    区块补齐引擎;
+    数据库大幅落后于链上最新区块时启动,与实时区块跟踪并行运行;
+    按窗口并发拉取落后区间的区块,再严格按区块号从小到大交给 store_block_with_txs 入库;
+    补齐期间到达的新区块暂存起来,补齐完成后交还给实时跟踪继续入库;
+    """
+
+    def __init__(
+        self,
+        chain: Chain,
+        fork_choice: ForkChoice,
+        backpressure: Backpressure,
+    ):
+        self.chain = chain
+        self.fork_choice = fork_choice
+        self.backpressure = backpressure
+        self.from_number = 0
+        self.to_number = 0
+        self.buffered: dict[int, AttributeDict] = {}
+        self.task: asyncio.Task | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self, from_number: int, to_number: int):
+        self.from_number, self.to_number = from_number, to_number
+        self.task = asyncio.create_task(self.run())
+        logger.info(f"{self.chain.name} 开始补齐区块 {from_number} - {to_number}")
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+
+    def buffer(self, block_datas: list[AttributeDict]):
+        """
+        暂存补齐期间到达的新区块;
+        暂存过多时直接把补齐终点延伸到最新区块,由补齐引擎按区块号拉取;
+        """
+        for block_data in block_datas:
+            if block_data["number"] > self.to_number:
+                self.buffered[block_data["number"]] = block_data
+
+        if len(self.buffered) > settings.MONITOR_BACKFILL_WINDOW:
+            self.to_number = max(self.buffered)
+            self.buffered.clear()
+
+    def take_buffered(self) -> list[AttributeDict]:
+        block_datas = [self.buffered[number] for number in sorted(self.buffered)]
+        self.buffered.clear()
+        return block_datas
+
+    async def fetch_window(
+        self,
+        from_number: int,
+        to_number: int,
+    ) -> tuple[list[AttributeDict], set[HexStr] | None]:
+        block_datas = await get_block_data_batch(
+            self.chain,
+            list(range(from_number, to_number + 1)),
+        )
+
+        transfer_tx_hashes = None
+        if self.chain.erc20_scan_mode == ERC20ScanMode.Logs:
+            transfer_tx_hashes = await get_transfer_tx_hashes(self.chain, block_datas)
+
+        return block_datas, transfer_tx_hashes
+
+    async def checkpoint(self, done_number: int | None):
+        await save_checkpoint(
+            self.chain,
+            self.fork_choice,
+            backfill_range=(
+                None
+                if done_number is None
+                else {
+                    "from": self.from_number,
+                    "to": self.to_number,
+                    "done": done_number,
+                }
+            ),
+        )
+
+    async def yield_to_workers(self):
+        """
+        队列积压时放慢补齐:限速时每个窗口入库前等待一段时间,降级时暂停直到队列恢复;
+        """
+        while (pressure := await self.backpressure.current()) > Pressure.Normal:
+            await asyncio.sleep(settings.MONITOR_THROTTLE_DELAY)
+            if pressure == Pressure.Throttled:
+                return
+
+    async def run(self):
+        window = settings.MONITOR_BACKFILL_WINDOW
+        next_number = self.from_number
+        fetching: deque[asyncio.Task] = deque()  # 按区块号顺序排列的并发拉取任务
 
         try:
-            block_filter = await chain.async_w3.eth.filter("latest")
-            while True:
-                new_block_hashes = await block_filter.get_new_entries()
-                new_block_data_batch = await get_block_data_batch(
-                    chain,
-                    new_block_hashes,
+            while next_number <= self.to_number or fetching:
+                while (
+                    len(fetching) < settings.MONITOR_BACKFILL_CONCURRENCY
+                    and next_number <= self.to_number
+                ):
+                    window_to = min(next_number + window - 1, self.to_number)
+                    fetching.append(
+                        asyncio.create_task(self.fetch_window(next_number, window_to)),
+                    )
+                    next_number = window_to + 1
+
+                block_datas, transfer_tx_hashes = await fetching.popleft()
+                await self.yield_to_workers()
+                for block_data in block_datas:
+                    await store_block_with_txs(
+                        self.chain,
+                        block_data,
+                        self.fork_choice,
+                        transfer_tx_hashes,
+                    )
+
+                await self.checkpoint(block_datas[-1]["number"])
+                logger.info(
+                    f"{self.chain.name} 区块补齐进度 "
+                    f"{block_datas[-1]['number']} / {self.to_number}",
                 )
 
-                (
-                    need_aligned,
-                    align_from_numer,
-                    align_to_numer,
-                ) = await chain.need_aligned(new_block_data_batch)
+            await self.checkpoint(None)
+
+        except Exception as e:
+            logger.error(f"Error in BlockBackfiller {self.chain.name}: {e}")
+
+        finally:
+            for task in fetching:
+                task.cancel()
+
+
+async def store_block_batch(
+    chain: Chain,
+    block_datas: list[AttributeDict],
+    fork_choice: ForkChoice,
+):
+    transfer_tx_hashes = None
+    if (
+        block_datas and chain.erc20_scan_mode == ERC20ScanMode.Logs
+    ):  # 整个区间只需一次 eth_getLogs
+        transfer_tx_hashes = await get_transfer_tx_hashes(chain, block_datas)
+
+    for block_data in block_datas:  # 此处需要保证必须按照从小到大的顺序插入区块
+        await store_block_with_txs(chain, block_data, fork_choice, transfer_tx_hashes)
+
+    if block_datas:
+        await save_head_checkpoint(chain, fork_choice)
+
+
+async def poll_new_block_hashes(chain: Chain, duration: float | None = None):
+    """
+    通过 eth_newBlockFilter 轮询新区块哈希;
+    轮询间隔根据本链的出块间隔与落后程度自适应调整;
+    :param duration: 轮询持续的秒数,为空则一直轮询
+    """
+    block_filter = await chain.async_w3.eth.filter("latest")
+    started_at = time.monotonic()
+    while duration is None or time.monotonic() - started_at < duration:
+        new_block_hashes = await block_filter.get_new_entries()
+        yield new_block_hashes
+        await asyncio.sleep(
+            poll_interval(local_block_time(chain.chain_id), len(new_block_hashes)),
+        )
+
+
+async def subscribe_new_block_hashes(chain: Chain):
+    """
+    通过 WebSocket 订阅 newHeads,新区块一到达就产出其哈希;
+    空闲时每秒产出一次空列表,以便监控循环及时响应链配置变更;
+    长时间没有收到新区块,视为连接失效并抛出 TimeoutError;
+    """
+    async with ws_connect(chain.ws_endpoint_uri) as ws:
+        await ws.send(
+            json.dumps(
+                {
+                    "jsonrpc": "2.0",
+                    "id": 1,
+                    "method": "eth_subscribe",
+                    "params": ["newHeads"],
+                },
+            ),
+        )
+        response = json.loads(await asyncio.wait_for(ws.recv(), timeout=16))
+        if "error" in response:
+            raise ValueError(response["error"])
+        logger.info(f"{chain.name} 已订阅 newHeads")
+
+        received_at = time.monotonic()
+        while True:
+            try:
+                message = json.loads(await asyncio.wait_for(ws.recv(), timeout=1))
+            except TimeoutError:
+                if time.monotonic() - received_at > settings.MONITOR_WS_STALE_TIMEOUT:
+                    raise
+                yield []
+                continue
+
+            if message.get("method") == "eth_subscription":
+                received_at = time.monotonic()
+                yield [message["params"]["result"]["hash"]]
+
+
+async def watch_new_block_hashes(chain: Chain):
+    """
+    持续产出新区块哈希;
+    配置了 WebSocket 节点时订阅 newHeads,订阅失败则自动退回轮询,一段时间后再重新尝试订阅;
+    """
+    if not chain.ws_endpoint_uri:
+        async for new_block_hashes in poll_new_block_hashes(chain):
+            yield new_block_hashes
+
+    while True:
+        try:
+            async for new_block_hashes in subscribe_new_block_hashes(chain):
+                yield new_block_hashes
+        except (OSError, TimeoutError, ValueError, KeyError, WebSocketException) as e:
+            logger.warning(f"{chain.name} newHeads 订阅中断,退回轮询: {e}")
+
+        async for new_block_hashes in poll_new_block_hashes(
+            chain,
+            duration=settings.MONITOR_WS_RETRY_INTERVAL,
+        ):
+            yield new_block_hashes
+
+
+async def subscribe_pending_tx_hashes(chain: Chain):
+    """
+    通过 WebSocket 订阅 newPendingTransactions,每秒产出一次这一秒内收到的交易哈希;
+    """
+    async with ws_connect(chain.ws_endpoint_uri) as ws:
+        await ws.send(
+            json.dumps(
+                {
+                    "jsonrpc": "2.0",
+                    "id": 1,
+                    "method": "eth_subscribe",
+                    "params": ["newPendingTransactions"],
+                },
+            ),
+        )
+        response = json.loads(await asyncio.wait_for(ws.recv(), timeout=16))
+        if "error" in response:
+            raise ValueError(response["error"])
+        logger.info(f"{chain.name} 已订阅 newPendingTransactions")
+
+        while True:
+            tx_hashes = []
+            deadline = time.monotonic() + 1
+            while (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    message = json.loads(
+                        await asyncio.wait_for(ws.recv(), timeout=timeout),
+                    )
+                except TimeoutError:
+                    break
+
+                if message.get("method") == "eth_subscription":
+                    tx_hashes.append(message["params"]["result"])
+
+            yield tx_hashes
+
+
+async def poll_pending_tx_hashes(chain: Chain):
+    """
+    通过 eth_newPendingTransactionFilter 每秒轮询一次新的待打包交易哈希;
+    """
+    pending_filter = await chain.async_w3.eth.filter("pending")
+    while True:
+        yield await pending_filter.get_new_entries()
+        await asyncio.sleep(1)
+
+
+async def dispatch_pending_txs(chain: Chain, tx_hashes: list[HexStr | bytes]):
+    """
+    批量获取待打包交易,粗筛出与平台地址相关的交易,投递临时通知任务;
+    """
+    raw_txs = await async_batch_request(
+        chain.endpoint_pool.read_uris(),
+        [
+            (
+                RPC.eth_getTransactionByHash,
+                [tx_hash if isinstance(tx_hash, str) else Web3.to_hex(tx_hash)],
+            )
+            for tx_hash in tx_hashes
+        ],
+        allow_null=True,  # 交易可能已被丢弃或替换
+    )
+    for raw_tx in raw_txs:
+        if raw_tx is None or raw_tx.get("blockNumber") is not None:
+            continue
+
+        tx = format_transaction(raw_tx)
+        if watched_addresses.match(chain.chain_id, tx):
+            notify_pending_transaction.delay(
+                chain.chain_id,
+                json.loads(chain.w3.to_json(tx)),
+            )
+
+
+async def watch_pending_transactions(chain: Chain, backpressure: Backpressure):
+    """
+    监听待打包交易,仅用于提前发送临时通知,入块后的处理不依赖于此;
+    配置了 WebSocket 节点时订阅 newPendingTransactions,否则轮询;任务队列积压时跳过;
+    """
+    set_rpc_priority(RPCPriority.Low)  # 只作用于本任务,让位于区块监控
+    watch = (
+        subscribe_pending_tx_hashes if chain.ws_endpoint_uri else poll_pending_tx_hashes
+    )
+    while True:
+        try:
+            async for tx_hashes in watch(chain):
+                if tx_hashes and await backpressure.current() == Pressure.Normal:
+                    await dispatch_pending_txs(chain, tx_hashes)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"{chain.name} 待打包交易监听中断: {e}")
+            await asyncio.sleep(settings.MONITOR_WS_RETRY_INTERVAL)
+
+
+async def apply_backpressure(
+    chain: Chain,
+    backpressure: Backpressure,
+    new_block_hashes: list[HexStr],
+    last_pressure: Pressure,
+) -> Pressure:
+    """
+    按任务队列的积压程度调整监控节奏,积压状态变化时记录日志;
+    限速时放慢拉取,降级时只发布链上最新区块号;
+    :param last_pressure: 上一轮的积压状态
+    :return: 本轮的积压状态,为 Degraded 时本轮的新区块不入库
+    """
+    pressure = await backpressure.current()
+    if pressure != last_pressure:
+        logger.log(
+            "INFO" if pressure == Pressure.Normal else "WARNING",
+            f"{chain.name} 任务队列积压状态: {PRESSURE_LABELS[pressure]}",
+        )
+
+    if pressure == Pressure.Degraded and new_block_hashes:
+        await apublish_head(
+            chain.chain_id,
+            HeadKind.Chain,
+            await get_header_number(chain, new_block_hashes[-1]),
+        )
+    elif pressure == Pressure.Throttled:
+        await asyncio.sleep(settings.MONITOR_THROTTLE_DELAY)
+
+    return pressure
+
+
+async def ingest_new_blocks(
+    chain: Chain,
+    new_block_data_batch: list[AttributeDict],
+    fork_choice: ForkChoice,
+    backfiller: BlockBackfiller,
+):
+    """
+    处理实时跟踪到的新区块;
+    补齐进行中时暂存新区块;否则连同补齐期间暂存的区块一起,
+    大幅落后于链上时交给补齐引擎,未落后则按区块号顺序入库;
+    """
+    if backfiller.active:
+        backfiller.buffer(new_block_data_batch)
+        return
+
+    new_block_data_batch = sorted(
+        {
+            block_data["number"]: block_data
+            for block_data in backfiller.take_buffered() + new_block_data_batch
+        }.values(),
+        key=lambda x: x["number"],
+    )
+    max_block_in_db = (
+        fork_choice.head.number if fork_choice.head else await chain.amax_block_in_db
+    )
 
-                if need_aligned:
+    if (
+        new_block_data_batch
+        and max_block_in_db
+        and new_block_data_batch[0]["number"] - max_block_in_db
+        > settings.MONITOR_BACKFILL_THRESHOLD
+    ):
+        backfiller.start(
+            max_block_in_db + 1,
+            new_block_data_batch[0]["number"] - 1,
+        )
+        backfiller.buffer(new_block_data_batch)
+    else:
+        await store_block_batch(chain, new_block_data_batch, fork_choice)
+
+
+async def monitor_the_chain(chain: Chain, backpressure: Backpressure):
+    """
+    监控区块链网络;
+    当数据库中的 Chain 数据发生变化时,由 main 取消本任务并以新的 Chain 数据重新启动;
+    监控过程中,需要判断数据库的最新区块,是否大幅落后于区块链,如果是的话,交给补齐引擎并行补齐,未落后则将当前最新区块入库;
+    Celery 队列积压时放慢拉取,积压严重时只跟踪区块头,队列恢复后由补齐引擎补齐期间的区块;
+    :param chain:
+    :param backpressure:
+    :return: None
+    """
+    set_rpc_priority(RPCPriority.High)  # 只作用于本链的监控任务
+    # 预先载入节点列表,之后在协程中访问 chain.endpoint_pool 与 chain.w3 不会再查询数据库
+    await sync_to_async(get_endpoint_pool)(chain)
+    fork_choice = await load_fork_choice(chain)
+    backfiller = BlockBackfiller(chain, fork_choice, backpressure)
+    await resume_from_checkpoint(chain, fork_choice, backfiller)
+    pending_watcher = (
+        asyncio.create_task(watch_pending_transactions(chain, backpressure))
+        if chain.mempool_watch
+        else None
+    )
+    last_pressure = Pressure.Normal
+    failed = False
+    try:
+        while True:
+            try:
+                # 确认任务删除被重组的区块时,其后代随之级联删除,缓冲中可能还留着这些区块;
+                # 出错后以数据库为准重新载入,否则之后的区块会一直建立在已删除的父区块上
+                if failed:
+                    await load_fork_choice(chain, fork_choice)
+                failed = True
+                async for new_block_hashes in watch_new_block_hashes(chain):
+                    last_pressure = await apply_backpressure(
+                        chain,
+                        backpressure,
+                        new_block_hashes,
+                        last_pressure,
+                    )
+                    if last_pressure == Pressure.Degraded:
+                        continue
+
+                    await watched_addresses.arefresh()
                     new_block_data_batch = await get_block_data_batch(
                         chain,
-                        list(range(align_from_numer, align_to_numer)),
+                        new_block_hashes,
                     )
+                    if new_block_data_batch:
+                        await apublish_head(
+                            chain.chain_id,
+                            HeadKind.Chain,
+                            new_block_data_batch[-1]["number"],
+                        )
 
-                for (
-                    new_block_data
-                ) in new_block_data_batch:  # 此处需要保证必须按照从小到大的顺序插入区块
-                    await store_block_with_txs(chain, new_block_data)
+                    await ingest_new_blocks(
+                        chain,
+                        new_block_data_batch,
+                        fork_choice,
+                        backfiller,
+                    )
 
-                if cache.get("chains_changed", False):
-                    logger.info(f"检测到链发生数据变更,重启{chain.name}监控")
-                    return
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                msg = f"Error in monitor_the_chain {chain.name}: {e}"
+                logger.error(msg)
                 await asyncio.sleep(1)
 
-        except asyncio.CancelledError:
-            return
+    finally:
+        backfiller.cancel()
+        if pending_watcher:
+            pending_watcher.cancel()
+        try:  # 停止前写入最新的检查点,重启后少重新投递一些区块
+            await save_checkpoint(chain, fork_choice)
         except Exception as e:
-            msg = f"Error in monitor_the_chain {chain.name}: {e}"
-            logger.error(msg)
-            await asyncio.sleep(1)
+            logger.warning(f"{chain.name} 写入检查点失败: {e}")
+
+
+class ChainSupervisor:
+    """
+    管理本实例所监控的链的监控任务;
+    通过租约与其它监控实例划分链的归属,只监控持有租约的链;
+    订阅 Chain 变更频道,只重启发生变更的链,其它链的监控不受影响;
+    """
+
+    def __init__(self, leases: ChainLeases, backpressure: Backpressure):
+        self.leases = leases
+        self.backpressure = backpressure
+        self.tasks: dict[int, asyncio.Task] = {}
+
+    def start(self, chain: Chain):
+        self.tasks[chain.chain_id] = asyncio.create_task(
+            monitor_the_chain(chain, self.backpressure),
+        )
+        logger.info(f"{chain.name} 监控启动成功")
+
+    def stop(self, chain_id: int):
+        task = self.tasks.pop(chain_id, None)
+        if task:
+            task.cancel()
+
+    async def release(self, chain_id: int):
+        self.stop(chain_id)
+        await self.leases.release(chain_id)
+
+    async def release_all(self):
+        for chain_id in list(self.tasks):
+            await self.release(chain_id)
+        await self.leases.leave()
+
+    async def restart(self, chain_id: int):
+        if chain_id not in self.tasks:  # 不归本实例监控,由持有租约的实例处理
+            return
+
+        self.stop(chain_id)
+        invalidate_clients(chain_id)
+
+        chain = await Chain.objects.filter(chain_id=chain_id, active=True).afirst()
+        if chain:
+            self.start(chain)
+        else:
+            logger.info(f"Chain {chain_id} 已停用或删除,停止监控")
+            await self.leases.release(chain_id)
+
+    async def restart_all(self):
+        for chain_id in list(self.tasks):
+            await self.restart(chain_id)
+
+    async def restart_finished(self):
+        # 监控任务正常情况下不会结束,结束了说明发生了意外,重新启动
+        for chain_id, task in list(self.tasks.items()):
+            if task.done():
+                await self.restart(chain_id)
+
+    async def rebalance(self):
+        """
+        心跳续期本实例持有的租约,接管无人持有的链,并释放超出均分数量的链;
+        """
+        await self.leases.heartbeat()
+
+        for chain_id in list(self.tasks):
+            if not await self.leases.renew(chain_id):
+                logger.warning(f"Chain {chain_id} 的租约已丢失,停止监控")
+                self.stop(chain_id)
+
+        active_chain_ids = {
+            chain_id
+            async for chain_id in Chain.objects.filter(active=True).values_list(
+                "chain_id",
+                flat=True,
+            )
+        }
+        for chain_id in set(self.tasks) - active_chain_ids:
+            await self.release(chain_id)
+
+        target_count = await self.leases.target_count(len(active_chain_ids))
+        for chain_id in sorted(active_chain_ids - set(self.tasks)):
+            if len(self.tasks) >= target_count:
+                break
+
+            if await self.leases.acquire(chain_id):
+                chain = await Chain.objects.filter(chain_id=chain_id).afirst()
+                if chain:
+                    self.start(chain)
+                else:
+                    await self.leases.release(chain_id)
+
+        if len(self.tasks) > target_count:  # 每轮只释放一条,留给其它实例接管
+            chain_id = max(self.tasks)
+            logger.info(f"Chain {chain_id} 交由其它监控实例接管")
+            await self.release(chain_id)
 
 
 async def main():
     """
     主函数,持续运行;
-    任务组的任务全部 return,说明数据库网络被修改,需要重新载入 Chain 参数进行监控;
+    定期通过租约与其它监控实例划分链的归属,并通过 Redis 订阅 Chain 变更,只重启受影响的链;
     :return:
     """
+    redis = aioredis.from_url(settings.CACHES["default"]["LOCATION"])
+    supervisor = ChainSupervisor(
+        ChainLeases(redis),
+        Backpressure(aioredis.from_url(settings.CELERY_BROKER_URL)),
+    )
+    heartbeat_interval = settings.MONITOR_LEASE_TTL / 3
+
     while True:
         try:
-            chains = Chain.objects.filter(active=True)
-            cache.set(key="chains_changed", value=False)
-            async with asyncio.TaskGroup() as task_group:
-                async for chain in chains:
-                    task_group.create_task(monitor_the_chain(chain))
-                    logger.info(f"{chain.name} 监控启动成功")
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(CHAINS_CHANGED_CHANNEL)
+                # (重新)订阅前的变更可能已经丢失,全部重启一次
+                await supervisor.restart_all()
+
+                rebalanced_at = 0.0
+                while True:
+                    try:
+                        if time.monotonic() - rebalanced_at >= heartbeat_interval:
+                            await supervisor.rebalance()
+                            rebalanced_at = time.monotonic()
+
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True,
+                            timeout=1,
+                        )
+                        if message:
+                            chain_id = int(message["data"])
+                            logger.info(f"检测到链 {chain_id} 发生数据变更,重启其监控")
+                            await supervisor.restart(chain_id)
+
+                        await supervisor.restart_finished()
+                    except RedisError:
+                        raise  # 订阅连接可能已失效,重新订阅
+                    except Exception as e:
+                        # 数据库等错误不能结束循环,否则租约不再续期,本实例的链全部停止监控
+                        logger.error(f"Error in main: {e}")
+                        await asyncio.sleep(1)
 
         except asyncio.CancelledError:
+            await supervisor.release_all()
             return
+        except Exception as e:
+            logger.error(f"Error in main: {e}")
         await asyncio.sleep(1)
 
 
@@ -1,12 +1,28 @@
+from decimal import Decimal
+
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction as db_transaction
 from django.db.models import Q
+from django.utils import timezone
 
+from chains.models import Account
 from chains.models import Block
+from chains.models import Chain
+from chains.models import ConfirmationMode
+from chains.models import MonitorCheckpoint
 from chains.models import Transaction
 from chains.models import TransactionQueue
+from chains.utils.heads import HeadKind
+from chains.utils.heads import publish_head
+from chains.utils.transactions import parse_pending_transfer
 from common.decorators import singleton_task
 from common.utils.time import ago
+from deposits.models import Deposit
+from invoices.models import Invoice
+from invoices.models import InvoiceType
+from notifications.models import Notification
 
 
 @shared_task(
@@ -42,6 +58,70 @@ def filter_and_store_tx(chain_id, block_number, tx_metadata):
         tx.initialize()
 
 
+@shared_task(
+    ignore_result=True,
+    max_retries=None,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_backoff_max=300,
+)
+@db_transaction.atomic
+def ingest_block(chain_id, block_number, txs_metadata):
+    """
+    以区块为单位入库交易:批量获取回执,批量插入 Transaction,并在同一个数据库事务中完成初始化;
+    :param chain_id:
+    :param block_number:
+    :param txs_metadata: 监控进程粗筛后的候选交易
+    """
+    block = Block.objects.select_related("chain").get(
+        chain__chain_id=chain_id,
+        number=block_number,
+    )
+    chain = block.chain
+
+    # 交易哈希全局唯一,重组后被打包进其它区块或经其它途径入库的交易也要跳过,否则批量插入冲突,整个区块无限重试
+    stored_hashes = set(
+        Transaction.objects.filter(
+            hash__in=[tx_metadata["hash"] for tx_metadata in txs_metadata],
+        ).values_list("hash", flat=True),
+    )
+    txs_metadata = [
+        tx_metadata
+        for tx_metadata in txs_metadata
+        if tx_metadata["hash"] not in stored_hashes
+    ]
+    if not txs_metadata:
+        return
+
+    # 候选交易已经过监控进程粗筛,先取回执,以便识别 transferFrom 与合约内的 ERC20 转账
+    receipts = chain.get_block_receipts(
+        block.hash,
+        [tx_metadata["hash"] for tx_metadata in txs_metadata],
+    )
+    txs_metadata = [
+        tx_metadata
+        for tx_metadata in txs_metadata
+        if chain.is_transaction_should_be_processed(
+            tx_metadata,
+            receipts[tx_metadata["hash"]],
+        )
+    ]
+    transactions = Transaction.objects.bulk_create(
+        [
+            Transaction(
+                hash=tx_metadata["hash"],
+                block=block,
+                transaction_index=tx_metadata["transactionIndex"],
+                metadata=tx_metadata,
+                receipt=receipts[tx_metadata["hash"]],
+            )
+            for tx_metadata in txs_metadata
+        ],
+    )
+    for tx in transactions:
+        tx.initialize()
+
+
 @shared_task(ignore_result=True)
 def transact_the_transaction_queue(pk):
     transaction_queue = TransactionQueue.objects.get(pk=pk)
@@ -68,12 +148,192 @@ def transact_platform_transactions():
 )
 @db_transaction.atomic
 def confirm_the_block(block_pk):
+    # 区块确认已改由 confirm_chain_blocks 定期批量处理,保留此任务只为消费升级前已排队的任务;
+    # 未能确认的区块交给批量确认任务,不再重复排队
     try:
         block = Block.objects.prefetch_related("transactions").get(pk=block_pk)
     except Block.DoesNotExist:
         return
 
-    if block.confirm_with_transactions():
+    block.confirm_with_transactions()
+
+
+@shared_task(ignore_result=True)
+@singleton_task(timeout=16)
+def confirm_blocks():
+    for chain_id in Chain.objects.filter(active=True).values_list(
+        "chain_id",
+        flat=True,
+    ):
+        confirm_chain_blocks.delay(chain_id)
+
+
+def blocks_confirmed_by_depth(chain: Chain) -> list[Block]:
+    """
+    确认数模式:一次批量 RPC 请求只取回已达到确认数的区块的区块头,与库中哈希一致的区块即可确认;
+    遇到哈希不一致的区块,说明其已被重组,删除该区块(后代区块随之级联删除),并只确认它之前的区块;
+    """
+    confirmable_number = chain.head_number - chain.block_confirmations_count
+
+    blocks = list(
+        Block.objects.filter(
+            chain=chain,
+            confirmed=False,
+            number__lte=confirmable_number,
+        ).order_by("number")[: settings.CONFIRM_BATCH_SIZE],
+    )
+    if not blocks:
+        return []
+
+    block_hashes = chain.get_block_hashes([block.number for block in blocks])
+
+    confirmed_blocks = []
+    for block in blocks:
+        if block_hashes[block.number] != block.hash:
+            block.delete()
+            break
+
+        confirmed_blocks.append(block)
+
+    return confirmed_blocks
+
+
+def blocks_confirmed_by_tag(chain: Chain) -> list[Block]:
+    """
+    safe / finalized 模式:只请求一次节点报告的 safe / finalized 区块,库中不高于它的区块均可确认;
+    库中区块按父哈希首尾相连,只需核对其中最高的一个;
+    哈希不一致说明库中是已被抛弃的分叉,删除该区块(后代区块随之级联删除),由下一轮继续核对更低的区块;
+    """
+    finality_number, finality_hash = chain.get_tagged_block(chain.confirmation_mode)
+    publish_head(chain.chain_id, HeadKind.Finality, finality_number)
+
+    blocks = list(
+        Block.objects.filter(
+            chain=chain,
+            confirmed=False,
+            number__lte=finality_number,
+        ).order_by("number")[: settings.CONFIRM_BATCH_SIZE],
+    )
+    if not blocks:
+        return []
+
+    highest_block = blocks[-1]
+    if highest_block.number == finality_number:
+        chain_hash = finality_hash
+    else:  # 积压超过一批或最终区块尚未入库时,需要单独取回最高区块的哈希
+        block_hashes = chain.get_block_hashes([highest_block.number])
+        chain_hash = block_hashes[highest_block.number]
+    if chain_hash != highest_block.hash:
+        highest_block.delete()
+        return []
+
+    return blocks
+
+
+@shared_task(ignore_result=True)
+@singleton_task(timeout=64, use_params=True)
+@db_transaction.atomic
+def confirm_chain_blocks(chain_id):
+    """
+    批量确认一条链上可确认的区块,按链的确认方式选出区块并核对哈希后,用一条 UPDATE 标记为已确认;
+    :param chain_id:
+    """
+    chain = Chain.objects.get(chain_id=chain_id)
+    if chain.confirmation_mode == ConfirmationMode.Depth:
+        confirmed_blocks = blocks_confirmed_by_depth(chain)
+    else:
+        confirmed_blocks = blocks_confirmed_by_tag(chain)
+
+    if not confirmed_blocks:
+        return
+
+    Block.objects.filter(pk__in=[block.pk for block in confirmed_blocks]).update(
+        confirmed=True,
+    )
+    MonitorCheckpoint.objects.update_or_create(
+        chain=chain,
+        defaults={"confirmed_number": confirmed_blocks[-1].number},
+    )
+    for tx in Transaction.objects.filter(block__in=confirmed_blocks).select_related(
+        "block__chain",
+    ):
+        tx.confirm()
+
+
+@shared_task(ignore_result=True)
+def notify_pending_transaction(chain_id, tx_metadata):
+    """
+    待打包交易转入平台充币地址或未支付的账单地址时,向开启了预通知的项目发送一次临时通知;
+    临时通知标记为未确认,最终结果仍以交易入块后的通知为准;
+    :param chain_id:
+    :param tx_metadata: 监控进程粗筛后的待打包交易
+    """
+    if not cache.add(
+        f"pending_tx_notified_{tx_metadata['hash']}",
+        value=True,
+        timeout=3600,
+    ):
+        return
+
+    if Transaction.objects.filter(hash=tx_metadata["hash"]).exists():  # 已经入块
+        return
+
+    chain = Chain.objects.get(chain_id=chain_id)
+    token_transfer = parse_pending_transfer(chain, tx_metadata)
+    if token_transfer is None:
         return
+
+    value = Decimal(token_transfer.value) / Decimal(10**token_transfer.token.decimals)
+    content = {
+        "chain_id": chain_id,
+        "block": None,
+        "hash": tx_metadata["hash"],
+        "timestamp": int(timezone.now().timestamp()),
+        "confirmed": False,
+        "pending": True,
+    }
+
+    account = (
+        Account.objects.filter(
+            address=token_transfer.to_address,
+            player__isnull=False,
+        )
+        .select_related("player__project")
+        .first()
+    )
+    if account:
+        project = account.player.project
+        # 与入块后的通知使用相同的字段,只有 confirmed / pending 不同
+        content.update(
+            Deposit(
+                player=account.player,
+                token=token_transfer.token,
+                value=value,
+            ).notification_content,
+        )
     else:
-        confirm_the_block.apply_async((block_pk,), countdown=4)
+        invoice = (
+            Invoice.objects.filter(
+                Q(
+                    type=InvoiceType.Contract,
+                    transaction_queue__transaction__isnull=True,
+                )
+                | Q(type=InvoiceType.Differ, value=value),  # 差额账单以应付数量区分
+                chain=chain,
+                pay_address=token_transfer.to_address,
+                token=token_transfer.token,
+                expired_time__gte=timezone.now(),
+                paid=False,
+            )
+            .select_related("project")
+            .first()
+        )
+        if invoice is None:
+            return
+
+        project = invoice.project
+        invoice.actual_value += value  # 计入本笔交易后的实收数量,只用于通知内容,不保存
+        content.update(invoice.notification_content)
+
+    if project.pre_notify:
+        Notification.objects.create(project=project, content=content)
@@ -0,0 +1,71 @@
+import pytest
+
+from chains.models import Account
+from chains.models import Block
+from chains.models import Chain
+from tokens.models import Token
+from tokens.models import TokenAddress
+from tokens.models import TokenType
+from users.models import User
+
+USDT_ADDRESS = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+
+
+def block_hash(number: int) -> str:
+    return f"0x{number:064x}"
+
+
+@pytest.fixture()
+def chain(db):
+    currency = Token.objects.create(symbol="ETH", decimals=18, type=TokenType.Native)
+    # bulk_create 不触发 chain_fill_up,测试中不访问节点
+    [chain] = Chain.objects.bulk_create(
+        [
+            Chain(
+                chain_id=1,
+                name="Ethereum",
+                currency=currency,
+                is_poa=False,
+                endpoint_uri="http://node.test",
+            ),
+        ],
+    )
+    return chain
+
+
+@pytest.fixture()
+def blocks(chain):
+    """
+    数据库中已入库的区块 10 - 12;
+    """
+    parent = None
+    result = []
+    for number in range(10, 13):
+        parent = Block.objects.create(
+            chain=chain,
+            number=number,
+            hash=block_hash(number),
+            parent=parent,
+            timestamp=number * 12,
+        )
+        result.append(parent)
+    return result
+
+
+@pytest.fixture()
+def usdt(chain):
+    token = Token.objects.create(symbol="USDT", decimals=6)
+    TokenAddress.objects.create(token=token, chain=chain, address=USDT_ADDRESS)
+    return token
+
+
+@pytest.fixture()
+def account(db):
+    return Account.generate()
+
+
+@pytest.fixture()
+def project(db):
+    # 超级用户不加入项目管理员组,无需先初始化用户组
+    user = User.objects.create(username="tester", is_superuser=True)
+    return user.project
@@ -0,0 +1,36 @@
+import asyncio
+
+from redis import asyncio as aioredis
+
+from chains.utils.backpressure import Backpressure
+from chains.utils.backpressure import Pressure
+
+QUEUE = "test_backpressure"
+
+
+def test_backpressure_current(settings):
+    settings.MONITOR_BACKPRESSURE_QUEUES = [QUEUE]
+    settings.MONITOR_QUEUE_HIGH_WATERMARK = 2
+    settings.MONITOR_QUEUE_CRITICAL_WATERMARK = 4
+
+    async def check():
+        broker = aioredis.from_url(settings.CELERY_BROKER_URL)
+        await broker.delete(QUEUE)
+        backpressure = Backpressure(broker)
+        assert await backpressure.current() == Pressure.Normal
+
+        await broker.rpush(QUEUE, 1, 2)
+        assert await backpressure.current() == Pressure.Normal  # 每秒最多查询一次
+        backpressure.checked_at = 0.0
+        assert await backpressure.current() == Pressure.Throttled
+
+        await broker.rpush(QUEUE, 3, 4)
+        backpressure.checked_at = 0.0
+        assert await backpressure.current() == Pressure.Degraded
+
+        await broker.delete(QUEUE)
+        backpressure.checked_at = 0.0
+        assert await backpressure.current() == Pressure.Normal
+        await broker.aclose()
+
+    asyncio.run(check())
@@ -0,0 +1,37 @@
+from chains.utils.bloom import TRANSFER_TOPIC_MASK
+from chains.utils.bloom import may_have_transfer
+from chains.utils.bloom import to_topic_mask
+from chains.utils.bloom import token_mask
+from chains.watchlist import WatchedAddresses
+
+USDT = "0xdAC17F958D2ee523a2206206994597C13D831ec7"
+PLATFORM = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+OTHER = "0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359"
+
+
+def test_may_have_transfer():
+    bloom = TRANSFER_TOPIC_MASK | token_mask(USDT) | to_topic_mask(PLATFORM)
+    logs_bloom = bloom.to_bytes(256, "big")
+    token_masks = [token_mask(USDT)]
+
+    assert may_have_transfer(logs_bloom, token_masks, [to_topic_mask(PLATFORM)])
+    assert not may_have_transfer(logs_bloom, token_masks, [to_topic_mask(OTHER)])
+    assert not may_have_transfer(bytes(256), token_masks, [to_topic_mask(PLATFORM)])
+
+    # 置位过多的 logsBloom 不再逐个比对
+    saturated = (TRANSFER_TOPIC_MASK | (1 << 1100) - 1).to_bytes(256, "big")
+    assert may_have_transfer(saturated, [], [])
+
+
+def test_watched_addresses_bloom_masks():
+    watched = WatchedAddresses()
+    watched.accounts = {PLATFORM}
+    watched.invoices[1] = {OTHER}
+    watched.tokens[1] = {USDT}
+    watched.build_bloom_masks()
+
+    assert watched.transfer_masks(1) == (
+        [token_mask(USDT)],
+        [to_topic_mask(PLATFORM), to_topic_mask(OTHER)],
+    )
+    assert watched.transfer_masks(56) == ([], [])
@@ -0,0 +1,37 @@
+from chains.utils.forkchoice import BlockRef
+from chains.utils.forkchoice import ForkChoice
+
+
+def ref(number, block_hash, parent_hash):
+    return BlockRef(number, block_hash, parent_hash, None)
+
+
+def test_extends_head():
+    fork_choice = ForkChoice(size=4)
+    fork_choice.push(ref(1, "0x01", "0x00"))
+    fork_choice.push(ref(2, "0x02", "0x01"))
+
+    assert fork_choice.extends_head(3, "0x02")
+    assert not fork_choice.extends_head(3, "0x01")
+    assert not fork_choice.extends_head(4, "0x02")
+
+
+def test_rewind_to_ancestor():
+    fork_choice = ForkChoice(size=4)
+    for number in range(1, 5):
+        fork_choice.push(ref(number, f"0x0{number}", f"0x0{number - 1}"))
+
+    ancestor = fork_choice.find("0x02")
+    fork_choice.rewind_to(ancestor.number)
+
+    assert fork_choice.head == ancestor
+    assert fork_choice.find("0x04") is None
+
+
+def test_push_gap_resets_buffer():
+    fork_choice = ForkChoice(size=4)
+    fork_choice.push(ref(1, "0x01", "0x00"))
+    fork_choice.push(ref(3, "0x03", "0x02"))
+
+    assert len(fork_choice) == 1
+    assert fork_choice.head.number == 3  # noqa: PLR2004
@@ -0,0 +1,41 @@
+from chains.constants import ERC20_TRANSFER_TOPIC
+from chains.tests.conftest import USDT_ADDRESS
+from chains.utils.logs import address_to_topic
+from chains.utils.logs import topic_to_address
+from chains.utils.logs import transfer_logs_call
+from chains.utils.logs import transfer_logs
+
+ADDRESS = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+OTHER = "0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359"
+
+
+def test_address_topic_round_trip():
+    topic = address_to_topic(ADDRESS)
+
+    assert len(topic) == 66  # noqa: PLR2004
+    assert topic_to_address(topic) == ADDRESS
+
+
+def test_transfer_logs_excludes_erc721():
+    erc20_log = {
+        "topics": [
+            ERC20_TRANSFER_TOPIC,
+            address_to_topic(ADDRESS),
+            address_to_topic(ADDRESS),
+        ],
+    }
+    erc721_log = {"topics": [*erc20_log["topics"], "0x" + "0" * 63 + "1"]}
+
+    assert transfer_logs({"logs": [erc20_log, erc721_log]}) == [erc20_log]
+
+
+def test_transfer_logs_call_drops_to_filter(settings):
+    settings.MONITOR_LOGS_TOPICS_PER_CALL = 1
+
+    _, [params] = transfer_logs_call(1, 2, [USDT_ADDRESS], {ADDRESS})
+    assert params["topics"] == [ERC20_TRANSFER_TOPIC, None, [address_to_topic(ADDRESS)]]
+
+    # 地址数量超过上限时仍只有一个调用,不再按 to 过滤
+    _, [params] = transfer_logs_call(1, 2, [USDT_ADDRESS], {ADDRESS, OTHER})
+    assert params["topics"] == [ERC20_TRANSFER_TOPIC]
+    assert params["address"] == [USDT_ADDRESS]
@@ -0,0 +1,100 @@
+from asgiref.sync import async_to_sync
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+from chains import monitoring
+from chains.models import MonitorCheckpoint
+from chains.tests.conftest import block_hash
+from chains.tests.test_transactions import EXTERNAL
+from chains.tests.test_transactions import SENDER
+from chains.utils.clients import get_endpoint_pool
+from chains.utils.forkchoice import BlockRef
+from chains.watchlist import WatchedAddresses
+
+
+class FakeBackfiller:
+    def __init__(self):
+        self.started = None
+
+    def start(self, from_number: int, to_number: int):
+        self.started = (from_number, to_number)
+
+
+def test_resume_from_checkpoint(monkeypatch, chain, blocks, account):
+    MonitorCheckpoint.objects.create(
+        chain=chain,
+        ingested_number=10,
+        ingested_hash=block_hash(10),
+        backfill_range={"from": 13, "to": 20, "done": 12},
+    )
+
+    reorged = {12: "0x" + "ee" * 32}  # 区块 12 在链上已被重组
+
+    async def get_block_data_batch(chain, numbers):
+        return [
+            AttributeDict(
+                {
+                    "number": number,
+                    "hash": HexBytes(reorged.get(number, block_hash(number))),
+                    "logsBloom": bytes(256),
+                    "transactions": [
+                        AttributeDict(
+                            {
+                                "hash": HexBytes(f"0x{number:064x}"),
+                                "from": SENDER,
+                                "to": to_address,
+                                "input": "0x",
+                                "value": 1,
+                            },
+                        )
+                        for to_address in (account.address, EXTERNAL)
+                    ],
+                },
+            )
+            for number in numbers
+        ]
+
+    dispatched = []
+
+    class FakeIngestBlock:
+        @staticmethod
+        def delay(chain_id, block_number, txs):
+            dispatched.append((block_number, [tx["to"] for tx in txs]))
+
+    monkeypatch.setattr(monitoring, "get_block_data_batch", get_block_data_batch)
+    monkeypatch.setattr(monitoring, "ingest_block", FakeIngestBlock)
+    # 模拟冷启动,平台地址集合尚未载入
+    monkeypatch.setattr(monitoring, "watched_addresses", WatchedAddresses())
+    get_endpoint_pool(chain)
+
+    fork_choice = async_to_sync(monitoring.load_fork_choice)(chain)
+    backfiller = FakeBackfiller()
+    async_to_sync(monitoring.resume_from_checkpoint)(chain, fork_choice, backfiller)
+
+    assert dispatched == [(11, [account.address])]
+    checkpoint = MonitorCheckpoint.objects.get(chain=chain)
+    assert checkpoint.ingested_number == 12  # noqa: PLR2004
+    assert checkpoint.ingested_hash == block_hash(12)
+    assert backfiller.started == (13, 20)
+
+
+def test_save_head_checkpoint(monkeypatch, settings, chain, blocks):
+    settings.MONITOR_CHECKPOINT_BLOCKS = 2
+    settings.MONITOR_CHECKPOINT_INTERVAL = 60
+    monkeypatch.setattr(monitoring, "_last_checkpoints", {})
+    fork_choice = async_to_sync(monitoring.load_fork_choice)(chain)
+
+    def checkpointed_number():
+        return MonitorCheckpoint.objects.get(chain=chain).ingested_number
+
+    async_to_sync(monitoring.save_head_checkpoint)(chain, fork_choice)
+    assert checkpointed_number() == 12  # noqa: PLR2004
+
+    # 链头推进的区块数量不足且未超时,不写入
+    fork_choice.push(BlockRef(13, block_hash(13), block_hash(12), None))
+    async_to_sync(monitoring.save_head_checkpoint)(chain, fork_choice)
+    assert checkpointed_number() == 12  # noqa: PLR2004
+
+    fork_choice.push(BlockRef(14, block_hash(14), block_hash(13), None))
+    async_to_sync(monitoring.save_head_checkpoint)(chain, fork_choice)
+    assert checkpointed_number() == 14  # noqa: PLR2004
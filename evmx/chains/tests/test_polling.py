@@ -0,0 +1,25 @@
+from chains.utils.polling import fetch_batch_size
+from chains.utils.polling import poll_interval
+
+
+def test_poll_interval(settings):
+    settings.MONITOR_POLL_MIN_INTERVAL = 0.2
+    settings.MONITOR_POLL_MAX_INTERVAL = 6
+
+    assert poll_interval(None, 0) == 1
+    assert poll_interval(12, 1) == 6  # noqa: PLR2004
+    assert poll_interval(0.25, 1) == 0.2  # noqa: PLR2004
+    assert poll_interval(3, 1) == 1.5  # noqa: PLR2004
+    assert poll_interval(12, 4) == 0.2  # noqa: PLR2004
+
+
+def test_fetch_batch_size(settings):
+    settings.MONITOR_RPC_BATCH_SIZE = 32
+    settings.MONITOR_RPC_BATCH_MAX_SIZE = 128
+
+    assert fetch_batch_size(1) == 32  # noqa: PLR2004
+    assert fetch_batch_size(64) == 64  # noqa: PLR2004
+    assert fetch_batch_size(1000) == 128  # noqa: PLR2004
+
+    settings.MONITOR_RPC_BATCH_SIZE = 1
+    assert fetch_batch_size(1000) == 1
@@ -0,0 +1,39 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django_redis import get_redis_connection
+
+from chains.utils.ratelimit import _try_acquire
+from chains.utils.ratelimit import configure_rate_limit
+from chains.utils.ratelimit import endpoint_label
+from chains.utils.ratelimit import max_batch_size
+from chains.utils.ratelimit import usage_key
+
+LIMITED = "http://limited.test"
+
+
+def test_batch_consumes_a_token_per_call():
+    configure_rate_limit(LIMITED, 10)
+    get_redis_connection("default").delete(f"rpc_bucket_{endpoint_label(LIMITED)}")
+
+    assert max_batch_size([LIMITED, "http://unlimited.test"], 128) == 10  # noqa: PLR2004
+    # 超过桶容量的批量请求在桶满时放行,透支的令牌由之后的请求等待补足
+    assert _try_acquire(LIMITED, ["eth_getBlockByNumber"] * 20) == 0
+    assert _try_acquire(LIMITED, ["eth_getBlockByNumber"]) > 1
+
+
+def test_rpc_usage_command():
+    hour = "2000010100"
+    redis = get_redis_connection("default")
+    redis.delete(usage_key(hour))
+    redis.hincrby(usage_key(hour), "node#1|eth_call", 3)
+    redis.hincrby(usage_key(hour), "node#1|eth_getLogs", 5)
+
+    out = StringIO()
+    call_command("rpc_usage", hour=hour, stdout=out)
+
+    assert out.getvalue().splitlines() == [
+        "合计 8 次调用",
+        "         5  node#1|eth_getLogs",
+        "         3  node#1|eth_call",
+    ]
@@ -0,0 +1,62 @@
+from chains.models import ChainEndpoint
+from chains.utils.clients import get_endpoint_pool
+from chains.utils.clients import invalidate_clients
+from chains.utils.router import Endpoint
+from chains.utils.router import EndpointPool
+from chains.utils.router import rank
+from chains.utils.router import record_failure
+from chains.utils.router import record_success
+
+
+def test_rank_by_latency_and_weight():
+    slow = Endpoint("http://slow.test", 1)
+    fast = Endpoint("http://fast.test", 1)
+    heavy = Endpoint("http://heavy.test", 4)
+    record_success(slow.uri, 0.8)
+    record_success(fast.uri, 0.2)
+    record_success(heavy.uri, 0.4)
+
+    assert rank([slow, fast, heavy]) == [heavy.uri, fast.uri, slow.uri]
+
+
+def test_eject_failing_endpoint(settings):
+    settings.CHAIN_RPC_EJECT_FAILURES = 2
+    settings.CHAIN_RPC_EJECT_SECONDS = 60
+    failing = Endpoint("http://failing.test", 1)
+    healthy = Endpoint("http://healthy.test", 1)
+    record_success(failing.uri, 0.1)
+    record_success(healthy.uri, 0.5)
+
+    record_failure(failing.uri)
+    assert rank([failing, healthy])[0] == failing.uri
+
+    record_failure(failing.uri)
+    assert rank([failing, healthy]) == [healthy.uri, failing.uri]
+
+
+def test_sticky_methods_use_primary():
+    pool = EndpointPool(
+        "http://primary.test",
+        read=[Endpoint("http://replica.test", 8)],
+    )
+    record_success("http://primary.test", 1)
+    record_success("http://replica.test", 0.1)
+
+    assert pool.uris("eth_getFilterChanges") == ["http://primary.test"]
+    assert pool.uris("eth_getBalance")[0] == "http://replica.test"
+    assert pool.uris("eth_sendRawTransaction") == ["http://primary.test"]
+
+
+def test_endpoint_pool_expires(settings, chain):
+    settings.CHAIN_ENDPOINT_POOL_TTL = 60
+    invalidate_clients(chain.chain_id)
+    assert get_endpoint_pool(chain).read_uris() == [chain.endpoint_uri]
+
+    # bulk_create 不触发信号,相当于其它进程新增了节点
+    ChainEndpoint.objects.bulk_create(
+        [ChainEndpoint(chain=chain, uri="http://replica.test")],
+    )
+    assert get_endpoint_pool(chain).read_uris() == [chain.endpoint_uri]
+
+    settings.CHAIN_ENDPOINT_POOL_TTL = 0
+    assert "http://replica.test" in get_endpoint_pool(chain).read_uris()
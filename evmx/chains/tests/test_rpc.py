@@ -0,0 +1,65 @@
+from hexbytes import HexBytes
+
+from chains.utils.rpc import _collect_batch_responses
+from chains.utils.rpc import block_call
+from chains.utils.rpc import format_block
+
+
+def test_block_call():
+    assert block_call(16) == ("eth_getBlockByNumber", ["0x10", True])
+    assert block_call("finalized", full_transactions=False) == (
+        "eth_getBlockByNumber",
+        ["finalized", False],
+    )
+    assert block_call("0x" + "ab" * 32, full_transactions=False) == (
+        "eth_getBlockByHash",
+        ["0x" + "ab" * 32, False],
+    )
+
+
+def test_collect_batch_responses():
+    results = [None] * 4
+    failed = _collect_batch_responses(
+        [
+            {"jsonrpc": "2.0", "id": 0, "result": {"number": "0x1"}},
+            {"jsonrpc": "2.0", "id": 1, "error": {"code": -32005}},
+            {"jsonrpc": "2.0", "id": 3, "result": None},
+        ],
+        [0, 1, 2, 3],
+        results,
+        allow_null=False,
+    )
+
+    assert failed == [1, 2, 3]
+    assert results[0] == {"number": "0x1"}
+
+
+def test_collect_batch_responses_rejected_batch():
+    results = [None] * 2
+    failed = _collect_batch_responses(
+        {"jsonrpc": "2.0", "id": None, "error": {"code": -32600}},
+        [0, 1],
+        results,
+        allow_null=True,
+    )
+
+    assert failed == [0, 1]
+
+
+def test_format_block():
+    block = format_block(
+        {
+            "number": "0x10",
+            "hash": "0x" + "ab" * 32,
+            "parentHash": "0x" + "cd" * 32,
+            "timestamp": "0x5f5e100",
+            "extraData": "0x" + "00" * 97,
+            "transactions": [],
+        },
+        is_poa=True,
+    )
+
+    assert block.number == 16  # noqa: PLR2004
+    assert block.hash == HexBytes("0x" + "ab" * 32)
+    assert block.parentHash == HexBytes("0x" + "cd" * 32)
+    assert len(block.proofOfAuthorityData) == 97  # noqa: PLR2004
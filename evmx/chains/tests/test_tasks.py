@@ -0,0 +1,170 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+
+from chains.models import Block
+from chains.models import Chain
+from chains.models import Transaction
+from chains.tasks import blocks_confirmed_by_tag
+from chains.tasks import ingest_block
+from chains.tasks import notify_pending_transaction
+from chains.tests.conftest import USDT_ADDRESS
+from chains.tests.conftest import block_hash
+from chains.tests.test_transactions import SENDER
+from chains.tests.test_transactions import transfer_input
+from invoices.models import Invoice
+from invoices.models import InvoiceType
+from notifications.models import Notification
+from users.models import Player
+
+PAY_ADDRESS = "0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB"
+TX_HASH = "0x" + "33" * 32
+
+
+@pytest.fixture()
+def differ_invoice(project, chain, usdt):
+    project.pre_notify = True
+    project.save()
+    return Invoice.objects.create(
+        project=project,
+        type=InvoiceType.Differ,
+        sys_no="S0001",
+        no="N0001",
+        subject="test",
+        token=usdt,
+        chain=chain,
+        value=Decimal("1.5"),
+        expired_time=timezone.now() + timedelta(hours=1),
+        pay_address=PAY_ADDRESS,
+        collection_address=PAY_ADDRESS,
+    )
+
+
+def notify(chain, value: int, to_address: str = PAY_ADDRESS):
+    cache.delete(f"pending_tx_notified_{TX_HASH}")
+    notify_pending_transaction(
+        chain.chain_id,
+        {
+            "hash": TX_HASH,
+            "from": SENDER,
+            "to": USDT_ADDRESS,
+            "input": transfer_input(to_address, value),
+            "value": 0,
+        },
+    )
+
+
+def test_notify_pending_invoice_payment(chain, differ_invoice):
+    notify(chain, 1_500_000)
+
+    notification = Notification.objects.get(project=differ_invoice.project)
+    # 与入块后的账单通知字段一致
+    differ_invoice.refresh_from_db()
+    differ_invoice.actual_value = differ_invoice.value
+    assert notification.content == {
+        "chain_id": chain.chain_id,
+        "block": None,
+        "hash": TX_HASH,
+        "timestamp": notification.content["timestamp"],
+        "confirmed": False,
+        "pending": True,
+        **differ_invoice.notification_content,
+    }
+
+    # 同一笔交易只通知一次
+    notify_pending_transaction(
+        chain.chain_id,
+        {"hash": TX_HASH, "from": SENDER, "to": PAY_ADDRESS, "input": "0x"},
+    )
+    assert Notification.objects.count() == 1
+
+
+def test_notify_pending_deposit(chain, usdt, project):
+    project.pre_notify = True
+    project.save()
+    player = Player.objects.create(project=project, uid="player")
+
+    notify(chain, 2_000_000, player.deposit_account.address)
+
+    notification = Notification.objects.get(project=project)
+    assert notification.content["pending"] is True
+    assert {
+        key: notification.content[key] for key in ("action", "uid", "symbol", "value")
+    } == {"action": "deposit", "uid": "player", "symbol": "USDT", "value": "2"}
+
+
+def test_notify_pending_skips_unmatched_invoice(chain, differ_invoice):
+    notify(chain, 1_000_000)  # 数量与差额账单不符
+    assert not Notification.objects.exists()
+
+    differ_invoice.paid = True
+    differ_invoice.save()
+    notify(chain, 1_500_000)
+    assert not Notification.objects.exists()
+
+
+def test_blocks_confirmed_by_tag(monkeypatch, chain, blocks):
+    monkeypatch.setattr(
+        Chain,
+        "get_tagged_block",
+        lambda self, tag: (12, block_hash(12)),
+    )
+    assert blocks_confirmed_by_tag(chain) == blocks
+
+    # 库中区块与节点报告的最终区块哈希不一致,删除分叉上最高的区块,本轮不确认
+    monkeypatch.setattr(
+        Chain,
+        "get_tagged_block",
+        lambda self, tag: (12, "0x" + "ee" * 32),
+    )
+    assert blocks_confirmed_by_tag(chain) == []
+    assert list(
+        Block.objects.order_by("number").values_list("number", flat=True),
+    ) == [10, 11]
+
+
+def test_blocks_confirmed_below_tag(monkeypatch, settings, chain, blocks):
+    settings.CONFIRM_BATCH_SIZE = 2
+    requested = []
+
+    def get_block_hashes(self, block_numbers):
+        requested.extend(block_numbers)
+        return {number: block_hash(number) for number in block_numbers}
+
+    monkeypatch.setattr(
+        Chain,
+        "get_tagged_block",
+        lambda self, tag: (12, block_hash(12)),
+    )
+    monkeypatch.setattr(Chain, "get_block_hashes", get_block_hashes)
+
+    # 积压超过一批时,单独核对本批最高区块的哈希
+    assert blocks_confirmed_by_tag(chain) == blocks[:2]
+    assert requested == [11]
+
+
+def test_ingest_block_skips_transactions_stored_in_another_block(
+    monkeypatch,
+    chain,
+    blocks,
+):
+    tx_metadata = {"hash": TX_HASH, "from": SENDER, "transactionIndex": 0}
+    Transaction.objects.create(
+        hash=TX_HASH,
+        block=blocks[1],
+        transaction_index=0,
+        metadata=tx_metadata,
+        receipt={},
+    )
+
+    def get_block_receipts(self, block_hash, tx_hashes):
+        raise AssertionError(tx_hashes)
+
+    monkeypatch.setattr(Chain, "get_block_receipts", get_block_receipts)
+
+    # 交易在重组后被打包进区块 12
+    ingest_block(chain.chain_id, 12, [tx_metadata])
+    assert Transaction.objects.get(hash=TX_HASH).block == blocks[1]
@@ -0,0 +1,133 @@
+import eth_abi
+from web3 import Web3
+
+from chains.constants import ERC20_TRANSFER_STARTS
+from chains.constants import ERC20_TRANSFER_TOPIC
+from chains.models import Block
+from chains.models import Transaction
+from chains.tests.conftest import USDT_ADDRESS
+from chains.utils.logs import address_to_topic
+from chains.utils.transactions import TransactionParser
+from chains.utils.transactions import parse_pending_transfer
+
+SENDER = "0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed"
+ROUTER = "0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359"
+EXTERNAL = "0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB"
+
+
+def transfer_log(log_index: int, from_address: str, to_address: str, value: int):
+    return {
+        "address": USDT_ADDRESS,
+        "topics": [
+            ERC20_TRANSFER_TOPIC,
+            address_to_topic(from_address),
+            address_to_topic(to_address),
+        ],
+        "data": Web3.to_hex(value.to_bytes(32, "big")),
+        "logIndex": Web3.to_hex(log_index),
+        "transactionIndex": "0x0",
+        "transactionHash": "0x" + "11" * 32,
+        "blockHash": "0x" + "22" * 32,
+        "blockNumber": "0x10",
+        "removed": False,
+    }
+
+
+def parse(chain, logs):
+    transaction = Transaction(
+        block=Block(chain=chain, number=16),
+        metadata={"from": SENDER, "to": ROUTER, "input": "0x12345678", "value": 0},
+        receipt={"status": "0x1", "logs": logs},
+    )
+    return TransactionParser(transaction).token_transfer
+
+
+def test_routed_transfer_to_platform_address(chain, usdt, account):
+    token_transfer = parse(
+        chain,
+        [
+            transfer_log(0, SENDER, ROUTER, 100),
+            transfer_log(1, ROUTER, account.address, 99),
+        ],
+    )
+
+    assert token_transfer.token == usdt
+    assert token_transfer.to_address == account.address
+    assert token_transfer.value == 99  # noqa: PLR2004
+
+
+def test_no_platform_transfer_event(chain, usdt):
+    token_transfer = parse(chain, [transfer_log(0, SENDER, EXTERNAL, 100)])
+
+    assert token_transfer.token == chain.currency
+    assert token_transfer.to_address == ROUTER
+    assert token_transfer.value == 0
+
+
+def transfer_input(to_address: str, value: int):
+    return (
+        ERC20_TRANSFER_STARTS
+        + eth_abi.encode(
+            ["address", "uint256"],
+            [to_address, value],
+        ).hex()
+    )
+
+
+def test_parse_pending_transfer(chain, usdt):
+    native = parse_pending_transfer(
+        chain,
+        {"from": SENDER, "to": EXTERNAL, "input": "0x", "value": 10**18},
+    )
+    assert native.token == chain.currency
+    assert native.to_address == EXTERNAL
+    assert native.value == 10**18
+
+    erc20 = parse_pending_transfer(
+        chain,
+        {
+            "from": SENDER,
+            "to": USDT_ADDRESS,
+            "input": transfer_input(EXTERNAL, 100),
+            "value": 0,
+        },
+    )
+    assert erc20.token == usdt
+    assert erc20.from_address == SENDER
+    assert erc20.to_address == EXTERNAL
+    assert erc20.value == 100  # noqa: PLR2004
+
+    # 不支持的代币,以及不转账的合约调用
+    assert (
+        parse_pending_transfer(
+            chain,
+            {
+                "from": SENDER,
+                "to": ROUTER,
+                "input": transfer_input(EXTERNAL, 100),
+                "value": 0,
+            },
+        )
+        is None
+    )
+    assert (
+        parse_pending_transfer(
+            chain,
+            {"from": SENDER, "to": ROUTER, "input": "0x12345678", "value": 0},
+        )
+        is None
+    )
+
+    # 调用数据被截断,无法解码
+    assert (
+        parse_pending_transfer(
+            chain,
+            {
+                "from": SENDER,
+                "to": USDT_ADDRESS,
+                "input": ERC20_TRANSFER_STARTS + "00" * 8,
+                "value": 0,
+            },
+        )
+        is None
+    )
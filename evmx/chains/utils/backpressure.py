@@ -0,0 +1,54 @@
+import asyncio
+import time
+from enum import IntEnum
+
+from django.conf import settings
+from redis.asyncio import Redis
+
+
+class Pressure(IntEnum):
+    Normal = 0
+    Throttled = 1  # 队列积压超过高水位,放慢拉取区块的速度
+    Degraded = 2  # 队列积压超过临界水位,只跟踪区块头,暂停入库与投递任务
+
+
+PRESSURE_LABELS = {
+    Pressure.Normal: "正常",
+    Pressure.Throttled: "限速",
+    Pressure.Degraded: "降级(只跟踪区块头)",
+}
+
+
+class Backpressure:
+    """
+    根据 Celery 队列的积压程度,决定监控进程投递任务的节奏;
+    所有链共享一个实例,队列长度每秒最多查询一次;
+    """
+
+    def __init__(self, broker: Redis):
+        self.broker = broker
+        self.pressure = Pressure.Normal
+        self.checked_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def queue_depth(self) -> int:
+        return sum(
+            [
+                await self.broker.llen(queue)
+                for queue in settings.MONITOR_BACKPRESSURE_QUEUES
+            ],
+        )
+
+    async def current(self) -> Pressure:
+        async with self.lock:
+            if time.monotonic() - self.checked_at >= 1:
+                depth = await self.queue_depth()
+                if depth >= settings.MONITOR_QUEUE_CRITICAL_WATERMARK:
+                    self.pressure = Pressure.Degraded
+                elif depth >= settings.MONITOR_QUEUE_HIGH_WATERMARK:
+                    self.pressure = Pressure.Throttled
+                else:
+                    self.pressure = Pressure.Normal
+                self.checked_at = time.monotonic()
+
+        return self.pressure
@@ -0,0 +1,57 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from common.consts import CALCULATE_BLOCK_TIME_COUNT
+
+DEFAULT_BLOCK_TIME = 16
+
+# 平滑系数取 2 / (N + 1),与最近 N 个区块的简单平均有相近的响应速度
+ALPHA = 2 / (CALCULATE_BLOCK_TIME_COUNT + 1)
+
+# 监控进程内每条链的出块间隔估计值
+_estimates: dict[int, float] = {}
+
+
+def block_time_key(chain_id: int) -> str:
+    return f"block_mining_time_{chain_id}"
+
+
+def observe_block_interval(chain_id: int, interval: float) -> float:
+    """
+    由监控进程在每个区块入库时调用,以指数加权移动平均更新出块间隔,并写入缓存供其它进程读取;
+    区块时间戳精确到秒,亚秒出块的链单个间隔只会是 0 或 1,经过平均后仍能收敛到实际出块间隔;
+    :param interval: 本区块与父区块的时间戳之差
+    :return: 更新后的出块间隔估计值
+    """
+    estimate = _estimates.get(chain_id)
+    if estimate is None:
+        estimate = cache.get(block_time_key(chain_id))
+
+    estimate = (
+        interval if estimate is None else ALPHA * interval + (1 - ALPHA) * estimate
+    )
+    _estimates[chain_id] = estimate
+    cache.set(block_time_key(chain_id), estimate, timeout=None)
+
+    return estimate
+
+
+async def aobserve_block_interval(chain_id: int, interval: float) -> float:
+    """
+    供监控进程在协程中调用;读写缓存是同步的 Redis 调用,放到线程中执行以免阻塞事件循环;
+    """
+    return await sync_to_async(observe_block_interval, thread_sensitive=False)(
+        chain_id,
+        interval,
+    )
+
+
+def local_block_time(chain_id: int) -> float | None:
+    """
+    本进程内的出块间隔估计值,供监控进程调度使用,无需访问缓存;
+    """
+    return _estimates.get(chain_id)
+
+
+def read_block_time(chain_id: int) -> float:
+    return cache.get(block_time_key(chain_id), DEFAULT_BLOCK_TIME)
@@ -0,0 +1,56 @@
+from collections.abc import Iterable
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+from chains.constants import ERC20_TRANSFER_TOPIC
+from chains.utils.logs import address_to_topic
+
+# 2048 位中置位超过一半时,任意地址的 3 个比特位都有 1/8 以上的概率全部命中,逐个比对已无筛选效果
+BLOOM_SATURATED_BITS = 1024
+
+
+def bloom_mask(item: bytes) -> int:
+    """
+    item 在 2048 位 logsBloom 中对应的 3 个比特位;
+    """
+    digest = Web3.keccak(item)
+    mask = 0
+    for i in range(0, 6, 2):
+        mask |= 1 << (int.from_bytes(digest[i : i + 2], "big") & 2047)
+
+    return mask
+
+
+def token_mask(token_address: str) -> int:
+    return bloom_mask(HexBytes(token_address))
+
+
+def to_topic_mask(to_address: str) -> int:
+    return bloom_mask(HexBytes(address_to_topic(to_address)))
+
+
+TRANSFER_TOPIC_MASK = bloom_mask(HexBytes(ERC20_TRANSFER_TOPIC))
+
+
+def may_have_transfer(
+    logs_bloom: bytes,
+    token_masks: Iterable[int],
+    to_masks: Iterable[int],
+) -> bool:
+    """
+    根据区块头的 logsBloom 判断区块中是否可能有转入平台地址的 ERC20 Transfer 事件;
+    布隆过滤器没有漏报,返回 False 时区块中一定没有此类事件,可以跳过 eth_getLogs;
+    :param token_masks: 代币合约地址的比特位,由 WatchedAddresses 在地址集合更新时预先计算
+    :param to_masks: 平台地址作为 indexed to 的比特位
+    """
+    bloom = int.from_bytes(logs_bloom, "big")
+    if bloom & TRANSFER_TOPIC_MASK != TRANSFER_TOPIC_MASK:
+        return False
+
+    if bloom.bit_count() >= BLOOM_SATURATED_BITS:
+        return True
+
+    return any(bloom & mask == mask for mask in token_masks) and any(
+        bloom & mask == mask for mask in to_masks
+    )
@@ -0,0 +1,282 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures import wait
+
+import aiohttp
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from web3 import AsyncWeb3
+from web3 import HTTPProvider
+from web3 import Web3
+from web3.middleware import async_geth_poa_middleware
+from web3.middleware import geth_poa_middleware
+from web3.types import RPCResponse
+
+from chains.utils.ratelimit import RPCRateLimitError
+from chains.utils.ratelimit import acquire
+from chains.utils.ratelimit import configure_rate_limit
+from chains.utils.router import BROADCAST_METHODS
+from chains.utils.router import Endpoint
+from chains.utils.router import EndpointPool
+from chains.utils.router import hedge_delay
+from chains.utils.router import record_failure
+from chains.utils.router import record_success
+
+# 进程内的客户端注册表,以 (chain_id, endpoint_uri, is_poa, rpc_rate_limit) 为键;
+# Chain 的节点地址、POA 属性或请求数上限变化后键随之变化,旧客户端会在创建新客户端时被清理
+_lock = threading.RLock()
+_w3_clients: dict[tuple, Web3] = {}
+_async_w3_clients: dict[tuple, AsyncWeb3] = {}
+_endpoint_pools: dict[tuple, tuple[EndpointPool, float]] = {}
+_sessions: dict[str, requests.Session] = {}
+_async_sessions: dict[tuple[int, str], aiohttp.ClientSession] = {}
+_hedge_executor: ThreadPoolExecutor | None = None
+
+
+def _client_key(chain) -> tuple:
+    return chain.chain_id, chain.endpoint_uri, chain.is_poa, chain.rpc_rate_limit
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    else:
+        return True
+
+
+def _drop_stale(clients: dict, key: tuple):
+    for stale_key in [k for k in clients if k[0] == key[0] and k != key]:
+        clients.pop(stale_key)
+
+
+def get_session(endpoint_uri: str) -> requests.Session:
+    """
+    获取节点对应的长连接 HTTP 会话,连接池大小由 CHAIN_RPC_POOL_SIZE 配置;
+    """
+    with _lock:
+        session = _sessions.get(endpoint_uri)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.CHAIN_RPC_POOL_SIZE,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[endpoint_uri] = session
+
+        return session
+
+
+def get_async_session(endpoint_uri: str) -> aiohttp.ClientSession:
+    """
+    获取节点对应的异步长连接会话;
+    aiohttp 会话与事件循环绑定,只能在协程中调用;
+    """
+    key = (id(asyncio.get_running_loop()), endpoint_uri)
+    session = _async_sessions.get(key)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.CHAIN_RPC_POOL_SIZE,
+                keepalive_timeout=60,
+            ),
+        )
+        _async_sessions[key] = session
+
+    return session
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor  # noqa: PLW0603
+    with _lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=settings.CHAIN_RPC_POOL_SIZE,
+                thread_name_prefix="rpc-hedge",
+            )
+
+        return _hedge_executor
+
+
+def get_endpoint_pool(chain) -> EndpointPool:
+    """
+    获取链的全部 HTTP RPC 节点;首次获取时查询数据库,之后缓存在本进程内;
+    只有保存变更的进程会立即清除缓存,Celery 等其它进程超过 CHAIN_ENDPOINT_POOL_TTL 后重新查询;
+    监控进程通过变更频道清除缓存,且协程中不能查询数据库,不按有效期重新查询;
+    """
+    if chain.chain_id is None:
+        return EndpointPool(chain.endpoint_uri)
+
+    key = _client_key(chain)
+    with _lock:
+        pool, built_at = _endpoint_pools.get(key, (None, 0.0))
+        if pool is None or (
+            time.monotonic() - built_at > settings.CHAIN_ENDPOINT_POOL_TTL
+            and not _in_event_loop()
+        ):
+            _drop_stale(_endpoint_pools, key)
+            pool = _build_endpoint_pool(chain)
+            _endpoint_pools[key] = (pool, time.monotonic())
+
+        return pool
+
+
+def get_w3(chain) -> Web3:
+    if chain.chain_id is None:  # 新建 Chain 时还未识别出 chain_id,不进入注册表
+        return _build_w3(chain)
+
+    key = _client_key(chain)
+    with _lock:
+        w3 = _w3_clients.get(key)
+        if w3 is None:
+            _drop_stale(_w3_clients, key)
+            w3 = _w3_clients[key] = _build_w3(chain)
+
+        return w3
+
+
+def get_async_w3(chain) -> AsyncWeb3:
+    if chain.chain_id is None:
+        return _build_async_w3(chain)
+
+    key = _client_key(chain)
+    with _lock:
+        aw3 = _async_w3_clients.get(key)
+        if aw3 is None:
+            _drop_stale(_async_w3_clients, key)
+            aw3 = _async_w3_clients[key] = _build_async_w3(chain)
+
+        return aw3
+
+
+def invalidate_clients(chain_id: int):
+    """
+    Chain 数据变更时,清除本进程内该链的所有客户端;
+    """
+    with _lock:
+        for clients in (_w3_clients, _async_w3_clients, _endpoint_pools):
+            for key in [k for k in clients if k[0] == chain_id]:
+                clients.pop(key)
+
+
+class RoutedHTTPProvider(HTTPProvider):
+    """
+    在链的多个节点之间路由请求的 HTTPProvider;
+    读请求发往评分最优的节点,超过对冲延迟仍未返回时,再向次优节点发送一次,取先返回的结果;
+    请求失败(连接错误、超时、限流)或本地令牌桶长时间取不到令牌时,依次切换到下一个节点;
+    """
+
+    def __init__(self, chain):
+        super().__init__(chain.endpoint_uri, session=get_session(chain.endpoint_uri))
+        self.chain = chain
+        self.providers: dict[str, HTTPProvider] = {}
+
+    def _provider(self, endpoint_uri: str) -> HTTPProvider:
+        provider = self.providers.get(endpoint_uri)
+        if provider is None:
+            provider = self.providers[endpoint_uri] = HTTPProvider(
+                endpoint_uri,
+                session=get_session(endpoint_uri),
+            )
+
+        return provider
+
+    def _request(self, endpoint_uri: str, method, params) -> RPCResponse:
+        acquire(endpoint_uri, [method])
+        started_at = time.monotonic()
+        try:
+            response = self._provider(endpoint_uri).make_request(method, params)
+        except (requests.RequestException, ValueError):
+            record_failure(endpoint_uri)
+            raise
+
+        record_success(endpoint_uri, time.monotonic() - started_at)
+        return response
+
+    def _submit(self, endpoint_uri: str, method, params) -> Future:
+        # 在调用方的上下文副本中执行,线程池中的请求沿用调用方的 RPC 优先级
+        return _get_hedge_executor().submit(
+            contextvars.copy_context().run,
+            self._request,
+            endpoint_uri,
+            method,
+            params,
+        )
+
+    def _hedged_request(self, endpoint_uris: list[str], method, params) -> RPCResponse:
+        futures = [self._submit(endpoint_uris[0], method, params)]
+        done, _ = wait(futures, timeout=hedge_delay(endpoint_uris[0]))
+        if not done or futures[0].exception():
+            futures.append(self._submit(endpoint_uris[1], method, params))
+
+        error = None
+        for future in as_completed(futures):
+            try:
+                return future.result()
+            except (requests.RequestException, ValueError, RPCRateLimitError) as e:
+                error = e
+
+        raise error
+
+    def make_request(self, method, params) -> RPCResponse:
+        endpoint_uris = get_endpoint_pool(self.chain).uris(method)
+
+        error = None
+        if len(endpoint_uris) > 1 and method not in BROADCAST_METHODS:
+            hedged_uris, endpoint_uris = endpoint_uris[:2], endpoint_uris[2:]
+            try:
+                return self._hedged_request(hedged_uris, method, params)
+            except (requests.RequestException, ValueError, RPCRateLimitError) as e:
+                error = e
+
+        for endpoint_uri in endpoint_uris:
+            try:
+                return self._request(endpoint_uri, method, params)
+            except (requests.RequestException, ValueError, RPCRateLimitError) as e:
+                error = e
+
+        raise error
+
+
+def _build_endpoint_pool(chain) -> EndpointPool:
+    from chains.models import EndpointRole
+
+    configure_rate_limit(chain.endpoint_uri, chain.rpc_rate_limit)
+
+    read, broadcast = [], []
+    for uri, weight, role, rate_limit in chain.endpoints.filter(
+        active=True,
+    ).values_list("uri", "weight", "role", "rate_limit"):
+        configure_rate_limit(uri, rate_limit)
+        if role != EndpointRole.Broadcast:
+            read.append(Endpoint(uri, weight))
+        if role != EndpointRole.Read:
+            broadcast.append(Endpoint(uri, weight))
+
+    return EndpointPool(chain.endpoint_uri, read, broadcast)
+
+
+def _build_w3(chain) -> Web3:
+    w3 = Web3(RoutedHTTPProvider(chain))
+    if chain.is_poa:
+        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+
+    return w3
+
+
+def _build_async_w3(chain) -> AsyncWeb3:
+    # 监控进程通过 async_w3 使用依赖节点本地状态的过滤器,固定使用主节点
+    aw3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(chain.endpoint_uri))
+    if chain.is_poa:
+        aw3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+
+    return aw3
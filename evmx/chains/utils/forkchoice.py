@@ -0,0 +1,62 @@
+from collections import deque
+from typing import NamedTuple
+
+from web3.types import HexStr
+
+
+class ReorgDepthExceededError(Exception):
+    pass
+
+
+class BlockRef(NamedTuple):
+    number: int
+    hash: HexStr
+    parent_hash: HexStr | None
+    block: object  # 已入库的 chains.Block,作为子区块的 parent,避免再次查询数据库
+
+
+class ForkChoice:
+    """
+    监控进程内每条链最近入库区块 (number, hash, parentHash) 的环形缓冲;
+    通过在内存中比较哈希判断新区块是否延续当前链头,只有真正分叉时才需要访问数据库;
+    """
+
+    def __init__(self, size: int):
+        self.refs: deque[BlockRef] = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.refs)
+
+    @property
+    def head(self) -> BlockRef | None:
+        return self.refs[-1] if self.refs else None
+
+    def find(self, block_hash: HexStr) -> BlockRef | None:
+        for ref in reversed(self.refs):
+            if ref.hash == block_hash:
+                return ref
+
+        return None
+
+    def extends_head(self, number: int, parent_hash: HexStr) -> bool:
+        return (
+            self.head is not None
+            and self.head.number + 1 == number
+            and self.head.hash == parent_hash
+        )
+
+    def push(self, ref: BlockRef):
+        if self.head is not None and ref.number != self.head.number + 1:
+            self.refs.clear()  # 不连续时缓冲失效,从此区块重新开始
+
+        self.refs.append(ref)
+
+    def rewind_to(self, number: int):
+        """
+        回退到指定区块号,丢弃其后的孤块;
+        """
+        while self.refs and self.refs[-1].number > number:
+            self.refs.pop()
+
+    def clear(self):
+        self.refs.clear()
@@ -0,0 +1,39 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+
+class HeadKind:
+    Chain = "chain"  # 链上最新区块
+    Db = "db"  # 数据库中已入库的最新区块
+    Finality = "finality"  # 节点报告的 safe / finalized 区块
+
+
+def head_key(chain_id: int, kind: str) -> str:
+    return f"chain_head_{kind}_{chain_id}"
+
+
+def publish_head(chain_id: int, kind: str, number: int):
+    """
+    由监控进程或确认任务发布链的最新区块号及发布时间,供其它进程读取;
+    超过 CHAIN_HEAD_TTL 没有更新即自动过期,读取方退回查询数据库或 RPC;
+    """
+    cache.set(
+        head_key(chain_id, kind),
+        {"number": number, "updated_at": time.time()},
+        timeout=settings.CHAIN_HEAD_TTL,
+    )
+
+
+async def apublish_head(chain_id: int, kind: str, number: int):
+    """
+    供监控进程在协程中发布;写缓存是同步的 Redis 调用,放到线程中执行以免阻塞事件循环;
+    """
+    await sync_to_async(publish_head, thread_sensitive=False)(chain_id, kind, number)
+
+
+def read_head(chain_id: int, kind: str) -> int | None:
+    head = cache.get(head_key(chain_id, kind))
+    return head["number"] if head else None
@@ -0,0 +1,90 @@
+import math
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from redis.asyncio import Redis
+
+# 只有租约仍归本实例所有时,才续期或释放
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+INSTANCES_KEY = "monitor_instances"
+
+
+class ChainLeases:
+    """
+    多个监控实例之间基于 Redis 租约划分链的归属;
+    每条链同一时间只由持有租约的实例监控,实例定期心跳续期,实例宕机后租约过期,其它实例在数秒内接管;
+    每个实例最多持有 ceil(启用链数 / 存活实例数) 条链,多出的租约会被主动释放,使链在实例间均匀分布;
+    """
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self.instance_id = (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self.ttl_ms = settings.MONITOR_LEASE_TTL * 1000
+
+    @staticmethod
+    def lease_key(chain_id: int) -> str:
+        return f"monitor_lease_{chain_id}"
+
+    async def heartbeat(self):
+        now = time.time()
+        await self.redis.zadd(INSTANCES_KEY, {self.instance_id: now})
+        await self.redis.zremrangebyscore(
+            INSTANCES_KEY,
+            "-inf",
+            now - settings.MONITOR_LEASE_TTL,
+        )
+
+    async def instances_count(self) -> int:
+        return max(await self.redis.zcard(INSTANCES_KEY), 1)
+
+    async def target_count(self, chains_count: int) -> int:
+        return math.ceil(chains_count / await self.instances_count())
+
+    async def acquire(self, chain_id: int) -> bool:
+        return bool(
+            await self.redis.set(
+                self.lease_key(chain_id),
+                self.instance_id,
+                px=self.ttl_ms,
+                nx=True,
+            ),
+        )
+
+    async def renew(self, chain_id: int) -> bool:
+        return bool(
+            await self.redis.eval(
+                RENEW_SCRIPT,
+                1,
+                self.lease_key(chain_id),
+                self.instance_id,
+                self.ttl_ms,
+            ),
+        )
+
+    async def release(self, chain_id: int):
+        await self.redis.eval(
+            RELEASE_SCRIPT,
+            1,
+            self.lease_key(chain_id),
+            self.instance_id,
+        )
+
+    async def leave(self):
+        await self.redis.zrem(INSTANCES_KEY, self.instance_id)
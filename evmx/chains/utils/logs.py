@@ -0,0 +1,57 @@
+from collections.abc import Collection
+
+from django.conf import settings
+from web3 import Web3
+from web3._utils.rpc_abi import RPC
+
+from chains.constants import ERC20_TRANSFER_TOPIC
+
+
+def address_to_topic(address: str) -> str:
+    return "0x" + "0" * 24 + address[2:].lower()
+
+
+def topic_to_address(topic: str) -> str:
+    return Web3.to_checksum_address("0x" + topic[-40:])
+
+
+def transfer_logs(receipt: dict) -> list[dict]:
+    """
+    从回执中筛选出 ERC20 Transfer 事件日志;
+    ERC721 的 Transfer 事件签名相同,但 tokenId 也被索引,topics 有 4 个,需要排除;
+    """
+    return [
+        log
+        for log in receipt["logs"]
+        if len(log["topics"]) == 3  # noqa: PLR2004
+        and log["topics"][0].lower() == ERC20_TRANSFER_TOPIC
+    ]
+
+
+def transfer_logs_call(
+    from_number: int,
+    to_number: int,
+    token_addresses: list[str],
+    to_addresses: Collection[str],
+) -> tuple[str, list]:
+    """
+    构造按区块区间查询 ERC20 Transfer 事件的 eth_getLogs 调用;
+    以代币合约地址和 indexed to 过滤;接收地址超过 MONITOR_LOGS_TOPICS_PER_CALL 时,
+    按 to 拆分的调用次数会随平台地址数量增长,此时不再按 to 过滤,
+    一次取回这些代币的全部 Transfer 事件,由调用方在本地筛选接收地址;
+    """
+    topics = [ERC20_TRANSFER_TOPIC]
+    if len(to_addresses) <= settings.MONITOR_LOGS_TOPICS_PER_CALL:
+        topics += [None, sorted(address_to_topic(address) for address in to_addresses)]
+
+    return (
+        RPC.eth_getLogs,
+        [
+            {
+                "fromBlock": Web3.to_hex(from_number),
+                "toBlock": Web3.to_hex(to_number),
+                "address": token_addresses,
+                "topics": topics,
+            },
+        ],
+    )
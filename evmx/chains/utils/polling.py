@@ -0,0 +1,36 @@
+from django.conf import settings
+
+
+def poll_interval(block_time: float | None, lag: int) -> float:
+    """
+    根据出块间隔与当前落后程度计算下一次轮询前的等待时间;
+    跟上链头时每半个出块间隔轮询一次,慢链不再每秒空转;
+    一次轮询拿到多个新区块说明已经落后,立即以最短间隔继续轮询,快链不再越落越远;
+    :param block_time: 出块间隔估计值,未知时按 1 秒处理
+    :param lag: 本次轮询拿到的新区块数量
+    """
+    if block_time is None:
+        return 1
+
+    if lag > 1:
+        return settings.MONITOR_POLL_MIN_INTERVAL
+
+    return min(
+        max(block_time / 2, settings.MONITOR_POLL_MIN_INTERVAL),
+        settings.MONITOR_POLL_MAX_INTERVAL,
+    )
+
+
+def fetch_batch_size(lag: int) -> int:
+    """
+    根据待拉取的区块数量确定每个 JSON-RPC 批量请求包含的区块数量;
+    落后越多批次越大,以更少的往返追上链头,但不超过 MONITOR_RPC_BATCH_MAX_SIZE;
+    MONITOR_RPC_BATCH_SIZE 设为 1 时始终逐个请求;
+    """
+    if settings.MONITOR_RPC_BATCH_SIZE <= 1:
+        return 1
+
+    return min(
+        max(lag, settings.MONITOR_RPC_BATCH_SIZE),
+        settings.MONITOR_RPC_BATCH_MAX_SIZE,
+    )
@@ -0,0 +1,181 @@
+import asyncio
+import contextvars
+import time
+from collections import Counter
+from contextlib import contextmanager
+from enum import IntEnum
+from hashlib import sha256
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from chains.utils.router import BROADCAST_METHODS
+
+# 令牌桶与调用计数在同一个脚本中完成,每次 RPC 调用只访问一次 Redis;
+# 桶容量等于每秒请求数,请求方需要给更高优先级的调用预留 ARGV[3] 个令牌;
+# 调用数超过桶容量的请求在桶满时放行,令牌数变为负数,之后的请求等待补足;
+# 返回需要等待的毫秒数,为 0 表示已取得令牌并完成计数
+ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local wait = 0
+
+if rate > 0 then
+    local time = redis.call("time")
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local bucket = redis.call("hmget", KEYS[1], "tokens", "ts")
+    local tokens = tonumber(bucket[1]) or rate
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(rate, tokens + (now - ts) * rate / 1000)
+
+    if tokens - cost < reserve then
+        wait = math.ceil((cost + reserve - tokens) * 1000 / rate)
+    else
+        tokens = tokens - cost
+    end
+
+    redis.call("hset", KEYS[1], "tokens", tokens, "ts", now)
+    redis.call("pexpire", KEYS[1], 60000)
+end
+
+if wait == 0 then
+    for i = 4, #ARGV, 2 do
+        redis.call("hincrby", KEYS[2], ARGV[i], ARGV[i + 1])
+    end
+    redis.call("expire", KEYS[2], 604800)
+end
+
+return wait
+"""
+
+
+class RPCPriority(IntEnum):
+    High = 0  # 区块监控、交易广播
+    Normal = 1  # 交易入库、区块确认等
+    Low = 2  # 归集时的余额查询等可以延后的调用
+
+
+# 各优先级需要为更高优先级预留的令牌比例
+RESERVED_RATIO = {
+    RPCPriority.High: 0,
+    RPCPriority.Normal: 0.2,
+    RPCPriority.Low: 0.5,
+}
+
+_priority: contextvars.ContextVar[RPCPriority] = contextvars.ContextVar(
+    "rpc_priority",
+    default=RPCPriority.Normal,
+)
+
+# 本进程内各节点地址的每秒请求数上限,0 表示不限制
+_rate_limits: dict[str, int] = {}
+
+
+class RPCRateLimitError(Exception):
+    pass
+
+
+@contextmanager
+def rpc_priority(priority: RPCPriority):
+    """
+    在此上下文中发起的 RPC 调用使用指定的优先级;
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_rpc_priority(priority: RPCPriority):
+    _priority.set(priority)
+
+
+def configure_rate_limit(endpoint_uri: str, rate_limit: int):
+    _rate_limits[endpoint_uri] = rate_limit
+
+
+def endpoint_label(endpoint_uri: str) -> str:
+    """
+    节点地址中常带有 API Key,统计中只记录域名和地址的摘要;
+    """
+    digest = sha256(endpoint_uri.encode("utf-8")).hexdigest()[:8]
+    return f"{urlparse(endpoint_uri).netloc}#{digest}"
+
+
+def usage_key(hour: str | None = None) -> str:
+    return f"rpc_usage_{hour or time.strftime('%Y%m%d%H', time.gmtime())}"
+
+
+def max_batch_size(endpoint_uris: list[str], batch_size: int) -> int:
+    """
+    一个批量请求中的调用数不超过所发往节点的每秒请求数上限,避免一次请求透支令牌桶;
+    """
+    rates = [_rate_limits.get(endpoint_uri, 0) for endpoint_uri in endpoint_uris]
+    return min([batch_size, *(rate for rate in rates if rate)])
+
+
+def _try_acquire(endpoint_uri: str, methods: list[str]) -> float:
+    rate = _rate_limits.get(endpoint_uri, 0)
+    cost = len(methods)
+
+    priority = _priority.get()
+    if BROADCAST_METHODS.intersection(methods):
+        priority = RPCPriority.High
+    reserve = min(rate * RESERVED_RATIO[priority], rate - cost)
+
+    label = endpoint_label(endpoint_uri)
+    counts = []
+    for method, count in Counter(methods).items():
+        counts.extend((f"{label}|{method}", count))
+
+    wait_ms = get_redis_connection("default").eval(
+        ACQUIRE_SCRIPT,
+        2,
+        f"rpc_bucket_{label}",
+        usage_key(),
+        rate,
+        cost,
+        reserve,
+        *counts,
+    )
+    return wait_ms / 1000
+
+
+def acquire(endpoint_uri: str, methods: list[str]):
+    """
+    调用节点前取得令牌,一个批量请求中的每个调用各消耗一个令牌;
+    超过 CHAIN_RPC_RATE_LIMIT_MAX_WAIT 仍未取得令牌则抛出 RPCRateLimitError,交由调用方重试;
+    """
+    deadline = time.monotonic() + settings.CHAIN_RPC_RATE_LIMIT_MAX_WAIT
+    while wait := _try_acquire(endpoint_uri, methods):
+        if time.monotonic() + wait > deadline:
+            msg = f"{endpoint_label(endpoint_uri)} 请求频率超出限制"
+            raise RPCRateLimitError(msg)
+        time.sleep(wait)
+
+
+async def aacquire(endpoint_uri: str, methods: list[str]):
+    # django_redis 的连接是同步的,放到线程中执行,不阻塞事件循环
+    try_acquire = sync_to_async(_try_acquire, thread_sensitive=False)
+    deadline = time.monotonic() + settings.CHAIN_RPC_RATE_LIMIT_MAX_WAIT
+    while wait := await try_acquire(endpoint_uri, methods):
+        if time.monotonic() + wait > deadline:
+            msg = f"{endpoint_label(endpoint_uri)} 请求频率超出限制"
+            raise RPCRateLimitError(msg)
+        await asyncio.sleep(wait)
+
+
+def rpc_usage(hour: str | None = None) -> dict[str, int]:
+    """
+    某个小时(UTC,格式 YYYYMMDDHH,默认当前小时)内各节点各方法的调用次数;
+    :return: {"节点|方法": 次数}
+    """
+    usage = get_redis_connection("default").hgetall(usage_key(hour))
+    return {
+        field.decode(): int(count)
+        for field, count in sorted(usage.items(), key=lambda x: -int(x[1]))
+    }
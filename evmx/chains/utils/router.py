@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+
+# 过滤器相关的方法依赖节点本地状态,必须始终发往主节点
+STICKY_METHODS = {
+    "eth_newFilter",
+    "eth_newBlockFilter",
+    "eth_newPendingTransactionFilter",
+    "eth_getFilterChanges",
+    "eth_getFilterLogs",
+    "eth_uninstallFilter",
+}
+BROADCAST_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+# 平滑系数,越大越看重最近的请求
+ALPHA = 0.2
+# 错误率对评分的放大倍数
+ERROR_PENALTY = 10
+
+
+class Endpoint(NamedTuple):
+    uri: str
+    weight: int
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency: float | None = None  # 请求耗时的指数加权移动平均(秒)
+        self.error_rate = 0.0  # 失败率的指数加权移动平均
+        self.failures = 0  # 连续失败次数
+        self.ejected_until = 0.0
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    def score(self, weight: int) -> float:
+        # 尚未测量过的节点评分为 0,优先尝试,以便尽快得到它的延迟
+        latency = self.latency or 0
+        return latency * (1 + ERROR_PENALTY * self.error_rate) / max(weight, 1)
+
+
+_lock = threading.Lock()
+_stats: dict[str, EndpointStats] = defaultdict(EndpointStats)
+
+
+def record_success(uri: str, latency: float):
+    with _lock:
+        stats = _stats[uri]
+        stats.latency = (
+            latency
+            if stats.latency is None
+            else ALPHA * latency + (1 - ALPHA) * stats.latency
+        )
+        stats.error_rate = (1 - ALPHA) * stats.error_rate
+        stats.failures = 0
+
+
+def record_failure(uri: str):
+    """
+    记录一次失败(连接错误、超时、限流等);连续失败达到阈值后,暂时把节点移出路由;
+    """
+    with _lock:
+        stats = _stats[uri]
+        stats.error_rate = ALPHA + (1 - ALPHA) * stats.error_rate
+        stats.failures += 1
+        if stats.failures >= settings.CHAIN_RPC_EJECT_FAILURES:
+            stats.ejected_until = time.monotonic() + settings.CHAIN_RPC_EJECT_SECONDS
+            stats.failures = 0
+
+
+def rank(endpoints: list[Endpoint]) -> list[str]:
+    """
+    按评分从优到劣排序节点;被移出路由的节点排在最后,只在其它节点都失败时兜底;
+    """
+    with _lock:
+        healthy = [e for e in endpoints if not _stats[e.uri].ejected]
+        ejected = [e for e in endpoints if _stats[e.uri].ejected]
+        healthy.sort(key=lambda e: _stats[e.uri].score(e.weight))
+        ejected.sort(key=lambda e: _stats[e.uri].ejected_until)
+
+    return [e.uri for e in healthy + ejected]
+
+
+def hedge_delay(uri: str) -> float:
+    """
+    读请求发出后超过此时间仍未返回,就向次优节点再发一次,取先返回的结果;
+    """
+    with _lock:
+        latency = _stats[uri].latency
+
+    if latency is None:
+        return settings.CHAIN_RPC_HEDGE_MIN_DELAY
+
+    return max(latency * 2, settings.CHAIN_RPC_HEDGE_MIN_DELAY)
+
+
+class EndpointPool:
+    """
+    一条链的全部 HTTP RPC 节点;Chain.endpoint_uri 作为主节点,同时承担读取与广播;
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        read: list[Endpoint] | None = None,
+        broadcast: list[Endpoint] | None = None,
+    ):
+        self.primary = primary
+        self.read = [Endpoint(primary, 1), *(read or [])]
+        self.broadcast = [Endpoint(primary, 1), *(broadcast or [])]
+
+    def uris(self, method: str) -> list[str]:
+        if method in STICKY_METHODS:
+            return [self.primary]
+
+        if method in BROADCAST_METHODS:
+            return rank(self.broadcast)
+
+        return rank(self.read)
+
+    def read_uris(self) -> list[str]:
+        return rank(self.read)
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+import requests
+from django.conf import settings
+from hexbytes import HexBytes
+from loguru import logger
+from web3 import Web3
+from web3._utils.method_formatters import (  # web3 内部 API,仅在 _pythonic 中使用
+    PYTHONIC_RESULT_FORMATTERS,
+)
+from web3._utils.rpc_abi import RPC
+from web3.datastructures import AttributeDict
+from web3.types import HexStr
+
+from chains.utils.clients import get_async_session
+from chains.utils.clients import get_session
+from chains.utils.ratelimit import RPCRateLimitError
+from chains.utils.ratelimit import aacquire
+from chains.utils.ratelimit import acquire
+from chains.utils.ratelimit import max_batch_size
+from chains.utils.router import hedge_delay
+from chains.utils.router import record_failure
+from chains.utils.router import record_success
+
+
+METHOD_NOT_FOUND = -32601
+
+# eth_getBlockByNumber 支持的区块标签
+BLOCK_TAGS = frozenset(("earliest", "latest", "pending", "safe", "finalized"))
+
+
+class RPCBatchError(Exception):
+    pass
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _batch_payload(calls: list[tuple[str, list]], indexes: list[int]) -> list[dict]:
+    return [
+        {
+            "jsonrpc": "2.0",
+            "id": index,
+            "method": calls[index][0],
+            "params": calls[index][1],
+        }
+        for index in indexes
+    ]
+
+
+def _collect_batch_responses(
+    responses,
+    indexes: list[int],
+    results: list,
+    *,
+    allow_null: bool,
+) -> list[int]:
+    """
+    把一次批量请求的响应按 id 填入 results;
+    :return: 本批次中失败(缺失、报错、或不允许为空却为空)的请求下标
+    """
+    if not isinstance(responses, list):  # 部分节点对批量请求整体报错时,返回的是单个对象
+        return list(indexes)
+
+    responses_by_id = {
+        response.get("id"): response
+        for response in responses
+        if isinstance(response, dict)
+    }
+
+    failed = []
+    for index in indexes:
+        response = responses_by_id.get(index)
+        if (
+            response is None
+            or "error" in response
+            or (response.get("result") is None and not allow_null)
+        ):
+            failed.append(index)
+        else:
+            results[index] = response.get("result")
+
+    return failed
+
+
+def _endpoint_uris(endpoint_uris: str | list[str], attempt: int) -> list[str]:
+    """
+    每次重试轮换到下一个节点,失败的调用优先交给其它节点处理;
+    """
+    if isinstance(endpoint_uris, str):
+        return [endpoint_uris]
+
+    offset = attempt % len(endpoint_uris)
+    return endpoint_uris[offset:] + endpoint_uris[:offset]
+
+
+async def _async_post(endpoint_uri: str, payload: list[dict]):
+    await aacquire(endpoint_uri, [call["method"] for call in payload])
+    started_at = time.monotonic()
+    try:
+        async with get_async_session(endpoint_uri).post(
+            endpoint_uri,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=16),
+        ) as resp:
+            resp.raise_for_status()
+            responses = await resp.json(content_type=None)
+    except (aiohttp.ClientError, TimeoutError, ValueError):
+        record_failure(endpoint_uri)
+        raise
+
+    record_success(endpoint_uri, time.monotonic() - started_at)
+    return responses
+
+
+async def _async_hedged_post(endpoint_uris: list[str], payload: list[dict]):
+    """
+    向最优节点发送批量请求,超过对冲延迟仍未返回或已失败时,再向次优节点发送一次,取先返回的结果;
+    """
+    tasks = [asyncio.create_task(_async_post(endpoint_uris[0], payload))]
+    done, _ = await asyncio.wait(tasks, timeout=hedge_delay(endpoint_uris[0]))
+    if len(endpoint_uris) > 1 and (not done or tasks[0].exception()):
+        tasks.append(asyncio.create_task(_async_post(endpoint_uris[1], payload)))
+
+    error = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except (
+                aiohttp.ClientError,
+                TimeoutError,
+                ValueError,
+                RPCRateLimitError,
+            ) as e:
+                error = e
+
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def async_batch_request(
+    endpoint_uris: str | list[str],
+    calls: list[tuple[str, list]],
+    *,
+    batch_size: int | None = None,
+    max_retries: int | None = None,
+    allow_null: bool = False,
+) -> list:
+    """
+    将多个 JSON-RPC 调用打包为批量请求发送,返回与 calls 顺序一一对应的原始结果;
+    批次内单个调用失败时,只把失败的调用重新打包重试,超过重试次数则抛出 RPCBatchError;
+    :param endpoint_uris: 节点地址,或按评分排好序的多个节点地址
+    :param calls: [(method, params), ...]
+    :param batch_size: 每个批量请求包含的调用数量
+    :param max_retries: 失败调用的最大重试次数
+    :param allow_null: 是否允许结果为 null(例如尚未出块的区块号,默认视为失败)
+    :return: 原始结果列表
+    """
+    batch_size = batch_size or settings.MONITOR_RPC_BATCH_SIZE
+    max_retries = (
+        settings.MONITOR_RPC_BATCH_MAX_RETRIES if max_retries is None else max_retries
+    )
+
+    results: list = [None] * len(calls)
+    pending = list(range(len(calls)))
+
+    for attempt in range(max_retries + 1):
+        attempt_uris = _endpoint_uris(endpoint_uris, attempt)
+        failed = []
+        for indexes in _chunks(
+            pending,
+            max_batch_size(attempt_uris[:2], batch_size),  # 可能对冲到次优节点
+        ):
+            try:
+                responses = await _async_hedged_post(
+                    attempt_uris,
+                    _batch_payload(calls, indexes),
+                )
+            except (
+                aiohttp.ClientError,
+                TimeoutError,
+                ValueError,
+                RPCRateLimitError,
+            ) as e:
+                logger.warning(f"批量请求 {attempt_uris[0]} 失败: {e}")
+                failed.extend(indexes)
+                continue
+
+            failed.extend(
+                _collect_batch_responses(
+                    responses,
+                    indexes,
+                    results,
+                    allow_null=allow_null,
+                ),
+            )
+
+        if not failed:
+            return results
+
+        pending = failed
+        if attempt < max_retries:
+            await asyncio.sleep(0.2 * 2**attempt)
+
+    msg = f"批量请求 {endpoint_uris} 中有 {len(pending)} 个调用在重试后仍然失败"
+    raise RPCBatchError(msg)
+
+
+def batch_request(
+    endpoint_uris: str | list[str],
+    calls: list[tuple[str, list]],
+    *,
+    batch_size: int | None = None,
+    max_retries: int | None = None,
+    allow_null: bool = False,
+) -> list:
+    """
+    async_batch_request 的同步版本,供 Celery 任务使用;失败时切换节点重试,不做对冲;
+    """
+    batch_size = batch_size or settings.MONITOR_RPC_BATCH_SIZE
+    max_retries = (
+        settings.MONITOR_RPC_BATCH_MAX_RETRIES if max_retries is None else max_retries
+    )
+
+    results: list = [None] * len(calls)
+    pending = list(range(len(calls)))
+
+    for attempt in range(max_retries + 1):
+        endpoint_uri = _endpoint_uris(endpoint_uris, attempt)[0]
+        session = get_session(endpoint_uri)
+        failed = []
+        for indexes in _chunks(pending, max_batch_size([endpoint_uri], batch_size)):
+            try:
+                acquire(endpoint_uri, [calls[index][0] for index in indexes])
+                started_at = time.monotonic()
+                resp = session.post(
+                    endpoint_uri,
+                    json=_batch_payload(calls, indexes),
+                    timeout=16,
+                )
+                resp.raise_for_status()
+                responses = resp.json()
+            except RPCRateLimitError as e:
+                logger.warning(e)
+                failed.extend(indexes)
+                continue
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"批量请求 {endpoint_uri} 失败: {e}")
+                record_failure(endpoint_uri)
+                failed.extend(indexes)
+                continue
+
+            record_success(endpoint_uri, time.monotonic() - started_at)
+            failed.extend(
+                _collect_batch_responses(
+                    responses,
+                    indexes,
+                    results,
+                    allow_null=allow_null,
+                ),
+            )
+
+        if not failed:
+            return results
+
+        pending = failed
+        if attempt < max_retries:
+            time.sleep(0.2 * 2**attempt)
+
+    msg = f"批量请求 {endpoint_uris} 中有 {len(pending)} 个调用在重试后仍然失败"
+    raise RPCBatchError(msg)
+
+
+def block_call(
+    block_identifier: HexStr | bytes | int,
+    *,
+    full_transactions: bool = True,
+) -> tuple[str, list]:
+    if isinstance(block_identifier, int):
+        return RPC.eth_getBlockByNumber, [
+            Web3.to_hex(block_identifier),
+            full_transactions,
+        ]
+
+    if block_identifier in BLOCK_TAGS:
+        return RPC.eth_getBlockByNumber, [block_identifier, full_transactions]
+
+    block_hash = (
+        block_identifier
+        if isinstance(block_identifier, str)
+        else Web3.to_hex(block_identifier)
+    )
+    return RPC.eth_getBlockByHash, [block_hash, full_transactions]
+
+
+def _pythonic(method: str, raw_result: dict) -> AttributeDict:
+    """
+    与 web3 的 get_block、get_transaction 等方法共用同一套结果格式化器;
+    格式化器属于 web3 内部 API,依赖 pyproject 中固定的 web3 版本,升级 web3 时由 test_rpc 检查;
+    """
+    return AttributeDict.recursive(PYTHONIC_RESULT_FORMATTERS[method](raw_result))
+
+
+def format_block(raw_block: dict, *, is_poa: bool = False) -> AttributeDict:
+    """
+    将节点返回的原始区块数据格式化为与 web3 get_block 一致的 AttributeDict;
+    POA 网络的 extraData 超出 32 字节,与 geth_poa_middleware 一样改名为 proofOfAuthorityData;
+    """
+    if is_poa and "extraData" in raw_block:
+        raw_block = dict(raw_block)
+        raw_block["proofOfAuthorityData"] = HexBytes(raw_block.pop("extraData"))
+
+    return _pythonic(RPC.eth_getBlockByNumber, raw_block)
+
+
+def format_transaction(raw_tx: dict) -> AttributeDict:
+    """
+    将节点返回的原始交易数据格式化为与 web3 get_transaction 一致的 AttributeDict;
+    """
+    return _pythonic(RPC.eth_getTransactionByHash, raw_tx)
+
+
+def pythonic_receipt(receipt: dict) -> AttributeDict:
+    """
+    将原始或已入库(JSON)的交易回执格式化为 web3 的 AttributeDict,可直接用于 process_receipt;
+    """
+    return _pythonic(RPC.eth_getTransactionReceipt, receipt)
+
+
+def format_receipt(raw_receipt: dict) -> dict:
+    """
+    将节点返回的原始交易回执格式化为与 Chain.get_transaction_receipt 一致的 JSON 字典;
+    """
+    return json.loads(Web3.to_json(pythonic_receipt(raw_receipt)))
@@ -0,0 +1,66 @@
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from django.core.cache import cache
+from web3._utils.rpc_abi import RPC
+
+# 结果在进程间共享的有效期,单位为秒;
+# 只合并允许短暂过期的只读调用,提币地址校验等要求实时结果的调用不经过此处
+TTLS = {
+    RPC.eth_gasPrice: 3,
+    RPC.eth_blockNumber: 1,
+}
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Exception | None = None
+
+
+_lock = threading.Lock()
+_calls: dict[str, _Call] = {}
+
+
+def single_flight(chain_id: int, method: str, func: Callable[[], Any], *args) -> Any:
+    """
+    合并相同的只读 RPC 调用:
+    本进程内同一时刻只有一个线程真正发起调用,其余线程等待并共享结果;
+    结果按方法的有效期写入缓存,其它进程在有效期内直接读取,不再请求节点;
+    :param chain_id:
+    :param method: RPC 方法名,决定结果的有效期
+    :param func: 真正发起调用的函数
+    :param args: 调用参数,与 chain_id、method 一起组成合并的键
+    """
+    key = f"rpc_single_flight_{chain_id}_{method}_{'_'.join(map(str, args))}"
+
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        call.event.wait()
+        if call.error:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = func()
+        cache.set(key, call.result, TTLS[method])
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.event.set()
+
+    return call.result
@@ -1,11 +1,21 @@
 from typing import NamedTuple
 
+import eth_abi
+from eth_abi.exceptions import DecodingError
+from hexbytes import HexBytes
+from web3 import Web3
 from web3.types import ChecksumAddress
 
 from chains.constants import ERC20_TRANSFER_STARTS
+from chains.models import Account
+from chains.models import Chain
 from chains.models import Transaction
+from chains.utils.logs import transfer_logs
+from chains.utils.rpc import pythonic_receipt
+from invoices.models import Invoice
 from tokens.models import Token
 from tokens.models import TokenAddress
+from tokens.models import TokenType
 from .contract import get_erc20_contract
 
 erc20_contract = get_erc20_contract()
@@ -22,10 +32,13 @@ class TransactionParser:
     def __init__(self, transaction: Transaction) -> None:
         self.chain = transaction.block.chain
         self.metadata = transaction.metadata
+        self.receipt = transaction.receipt
 
     @property
     def token_transfer(self) -> TokenTransferTuple:
-        if self.metadata["input"].startswith(ERC20_TRANSFER_STARTS):
+        if self.metadata["input"].startswith(ERC20_TRANSFER_STARTS) or (
+            self.metadata["value"] == 0 and transfer_logs(self.receipt)
+        ):  # 直接调用 transfer,或通过 transferFrom、合约间接转移代币
             return self._erc20_transfer()
         return self._currency_transfer()
 
@@ -38,15 +51,110 @@ class TransactionParser:
         )
 
     def _erc20_transfer(self) -> TokenTransferTuple:
-        receipt = self.chain.w3.eth.get_transaction_receipt(self.metadata["hash"])
-        transfer_event = erc20_contract.events.Transfer().process_receipt(receipt)[0]
+        # 复用入库时已获取的回执,不再重复请求节点
+        transfer_events = erc20_contract.events.Transfer().process_receipt(
+            pythonic_receipt(self.receipt),
+        )
+        token_addresses = {
+            token_address.address: token_address
+            for token_address in TokenAddress.objects.filter(
+                chain=self.chain,
+                address__in={event["address"] for event in transfer_events},
+            ).select_related("token")
+        }
+        token_events = [
+            event for event in transfer_events if event["address"] in token_addresses
+        ]
+        platform_addresses = self._platform_addresses(
+            {event["args"]["to"] for event in token_events}
+            | {event["args"]["from"] for event in token_events},
+        )
+        # 经路由合约、DEX 或多跳转账时,交易中还有转给中间地址的 Transfer 事件,不能直接取第一个;
+        # 优先取转入平台地址的事件(充值、支付),其次取由平台地址转出的事件(提币、归集)
+        transfer_event = next(
+            (
+                event
+                for event in token_events
+                if event["args"]["to"] in platform_addresses
+            ),
+            None,
+        ) or next(
+            (
+                event
+                for event in token_events
+                if event["args"]["from"] in platform_addresses
+            ),
+            None,
+        )
+        # 没有与平台地址相关的代币转账,与非代币转账的交易一样处理
+        if transfer_event is None:
+            return self._currency_transfer()
 
         return TokenTransferTuple(
-            TokenAddress.objects.get(
-                chain=self.chain,
-                address=transfer_event["address"],
-            ).token,
+            token_addresses[transfer_event["address"]].token,
             transfer_event["args"]["from"],
             transfer_event["args"]["to"],
             transfer_event["args"]["value"],
         )
+
+    def _platform_addresses(self, addresses: set[str]) -> set[str]:
+        """
+        从给定地址中筛选出平台地址:平台内部账户,或本链上账单的收款地址;
+        """
+        if not addresses:
+            return set()
+
+        return set(
+            Account.objects.filter(address__in=addresses).values_list(
+                "address",
+                flat=True,
+            ),
+        ) | set(
+            Invoice.objects.filter(
+                chain=self.chain,
+                pay_address__in=addresses,
+            ).values_list("pay_address", flat=True),
+        )
+
+
+def parse_pending_transfer(chain: Chain, metadata: dict) -> TokenTransferTuple | None:
+    """
+    解析待打包交易中的转账;待打包交易没有回执,只能识别原生币转账与直接调用 transfer 的 ERC20 转账;
+    :return: 不是平台所支持代币的转账时返回 None
+    """
+    if not metadata["input"].startswith(ERC20_TRANSFER_STARTS):
+        if metadata["value"] == 0:
+            return None
+        return TokenTransferTuple(
+            chain.currency,
+            metadata["from"],
+            metadata["to"],
+            metadata["value"],
+        )
+
+    token_address = (
+        TokenAddress.objects.filter(
+            chain=chain,
+            address=metadata["to"],
+            token__type=TokenType.ERC20,
+        )
+        .select_related("token")
+        .first()
+    )
+    if token_address is None:
+        return None
+
+    try:
+        to_address, value = eth_abi.decode(
+            ["address", "uint256"],
+            HexBytes(metadata["input"])[4:],
+        )
+    except (DecodingError, ValueError):  # 待打包交易的调用数据不可信,可能无法解码
+        return None
+
+    return TokenTransferTuple(
+        token_address.token,
+        metadata["from"],
+        Web3.to_checksum_address(to_address),
+        value,
+    )
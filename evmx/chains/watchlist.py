@@ -0,0 +1,225 @@
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+from loguru import logger
+from web3 import Web3
+
+from chains.constants import ERC20_TRANSFER_STARTS
+from chains.models import Account
+from chains.utils.bloom import to_topic_mask
+from chains.utils.bloom import token_mask
+from invoices.models import Invoice
+from tokens.models import TokenAddress
+from tokens.models import TokenType
+
+WATCHLIST_FEED_KEY = "watched_addresses_feed"
+WATCHLIST_FEED_MAXLEN = 100_000
+
+
+class WatchKind:
+    Account = "account"
+    Invoice = "invoice"
+    Token = "token"  # noqa: S105 代币合约地址的变更类型,不是密码
+
+
+def publish_watch_change(kind: str, address: str, chain_id=None, *, removed=False):
+    """
+    向变更流写入一条平台地址的增删记录,供监控进程增量更新内存中的地址集合;
+    """
+    get_redis_connection("default").xadd(
+        WATCHLIST_FEED_KEY,
+        {
+            "kind": kind,
+            "address": address,
+            "chain_id": chain_id or "",
+            "removed": int(removed),
+        },
+        maxlen=WATCHLIST_FEED_MAXLEN,
+        approximate=True,
+    )
+
+
+def _selector(tx_input) -> str:
+    if isinstance(tx_input, bytes):
+        return Web3.to_hex(tx_input[:4])
+
+    return tx_input[:10]
+
+
+class WatchedAddresses:
+    """
+    监控进程内常驻的平台地址集合,用于在投递 Celery 任务之前过滤掉与平台无关的交易;
+    启动时全量载入,之后通过变更流增量更新,并定期全量重载以剔除已失效的地址;
+    这里只做粗筛,是否处理交易仍以 Chain.is_transaction_should_be_processed 为准;
+    """
+
+    def __init__(self):
+        self.accounts: set[str] = set()
+        self.invoices: dict[int, set[str]] = defaultdict(set)
+        self.tokens: dict[int, set[str]] = defaultdict(set)
+        self.last_feed_id = "0-0"
+        self.loaded_at: float | None = None
+        # 每条链的 (代币合约比特位, 平台地址 to topic 比特位),供 logsBloom 预筛使用
+        self.bloom_masks: dict[int, tuple[list[int], list[int]]] = {}
+        self._to_masks: dict[str, int] = {}
+
+    def load(self):
+        redis = get_redis_connection("default")
+        last_entries = redis.xrevrange(WATCHLIST_FEED_KEY, count=1)
+        # 先记下变更流的位置再查库,载入期间发生的变更会在下次增量更新时重复应用,不会遗漏
+        last_feed_id = last_entries[0][0] if last_entries else "0-0"
+
+        accounts = set(Account.objects.values_list("address", flat=True))
+
+        invoices = defaultdict(set)
+        for chain_id, pay_address in Invoice.objects.filter(
+            transaction_queue__transaction__isnull=True,
+        ).values_list("chain_id", "pay_address"):
+            invoices[chain_id].add(pay_address)
+
+        tokens = defaultdict(set)
+        for chain_id, address in TokenAddress.objects.filter(
+            active=True,
+            token__type=TokenType.ERC20,
+        ).values_list("chain_id", "address"):
+            tokens[chain_id].add(address)
+
+        self.accounts, self.invoices, self.tokens = accounts, invoices, tokens
+        self.last_feed_id = last_feed_id
+        self.loaded_at = time.monotonic()
+        self.build_bloom_masks()
+        logger.info(f"平台地址集合载入完成,共 {len(accounts)} 个账户地址")
+
+    def apply_feed(self):
+        redis = get_redis_connection("default")
+        changed = False
+        while True:
+            entries = redis.xrange(
+                WATCHLIST_FEED_KEY,
+                min=f"({_decode(self.last_feed_id)}",
+                count=1000,
+            )
+            if not entries:
+                break
+
+            changed = True
+
+            for feed_id, fields in entries:
+                self._apply(
+                    {_decode(key): _decode(value) for key, value in fields.items()},
+                )
+                self.last_feed_id = feed_id
+
+        if changed:
+            self.build_bloom_masks()
+
+    def build_bloom_masks(self):
+        """
+        地址集合更新后,重新组装每条链的 logsBloom 比特位;
+        在 arefresh 的线程中执行,事件循环中只读取组装好的结果;
+        每个地址的 keccak 只在首次出现时计算,之后复用,并随集合剔除已失效的地址;
+        """
+        cached = self._to_masks
+        to_masks = {
+            address: cached.get(address) or to_topic_mask(address)
+            for address in self.accounts.union(*self.invoices.values())
+        }
+        account_masks = [to_masks[address] for address in self.accounts]
+
+        self._to_masks = to_masks
+        self.bloom_masks = {
+            chain_id: (
+                [token_mask(address) for address in token_addresses],
+                account_masks
+                + [to_masks[address] for address in self.invoices[chain_id]],
+            )
+            for chain_id, token_addresses in self.tokens.items()
+            if token_addresses
+        }
+
+    def _apply(self, change: dict):
+        address = change["address"]
+        removed = change["removed"] == "1"
+
+        if change["kind"] == WatchKind.Account:
+            addresses = self.accounts
+        elif change["kind"] == WatchKind.Invoice:
+            addresses = self.invoices[int(change["chain_id"])]
+        else:
+            addresses = self.tokens[int(change["chain_id"])]
+
+        if removed:
+            addresses.discard(address)
+        else:
+            addresses.add(address)
+
+    async def arefresh(self):
+        if (
+            self.loaded_at is None
+            or time.monotonic() - self.loaded_at
+            > settings.MONITOR_WATCHLIST_RELOAD_INTERVAL
+        ):
+            await sync_to_async(self.load)()
+        else:  # 变更流在 Redis 中,同步读取会阻塞事件循环
+            await sync_to_async(self.apply_feed)()
+
+    def transfer_masks(self, chain_id: int) -> tuple[list[int], list[int]]:
+        return self.bloom_masks.get(chain_id, ([], []))
+
+    def platform_addresses(self, chain_id: int) -> set[str]:
+        return self.accounts | self.invoices[chain_id]
+
+    def match(self, chain_id: int, tx, *, by_input=True) -> bool:
+        """
+        :param by_input: 是否根据交易调用数据识别 ERC20 转账;事件日志模式下由 eth_getLogs 识别,无需在此判断
+        """
+        tx_from, tx_to = tx["from"], tx["to"]
+
+        if (
+            by_input
+            and tx_to in self.tokens[chain_id]
+            and _selector(tx["input"]) == ERC20_TRANSFER_STARTS
+        ):  # 平台所支持的 ERC20 代币的转账 (transfer)
+            return True
+
+        if tx_to in self.invoices[chain_id]:  # 转入平台内的账单地址
+            return True
+
+        return tx_from in self.accounts or tx_to in self.accounts  # 平台内部账户相关
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+watched_addresses = WatchedAddresses()
+
+
+@receiver(post_save, sender=Account)
+def account_watched(sender, instance: Account, created, **kwargs):
+    if created:
+        publish_watch_change(WatchKind.Account, instance.address)
+
+
+@receiver(post_save, sender=Invoice)
+def invoice_watched(sender, instance: Invoice, created, **kwargs):
+    if created:
+        publish_watch_change(WatchKind.Invoice, instance.pay_address, instance.chain_id)
+
+
+@receiver(post_save, sender=TokenAddress)
+def token_address_watched(sender, instance: TokenAddress, **kwargs):
+    if instance.token.type != TokenType.ERC20:
+        return
+
+    publish_watch_change(
+        WatchKind.Token,
+        instance.address,
+        instance.chain_id,
+        removed=not instance.active,
+    )
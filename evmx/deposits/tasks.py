@@ -3,6 +3,8 @@ from django.db.models import Q
 
 from chains.models import Account
 from chains.models import Chain
+from chains.utils.ratelimit import RPCPriority
+from chains.utils.ratelimit import rpc_priority
 from common.decorators import singleton_task
 from common.utils.time import ago
 from globals.models import Project
@@ -19,26 +21,30 @@ def gather_deposits():
     tokens = list(Token.objects.all())
     projects = list(Project.objects.all())
 
-    for project in projects:
-        for chain in chains:
-            gather_time_ago = ago(
-                seconds=chain.block_confirmations_count * chain.block_mining_time * 2,
-            )
+    # 归集可以延后,节点请求额度紧张时让位于监控、广播等调用
+    with rpc_priority(RPCPriority.Low):
+        for project in projects:
+            for chain in chains:
+                gather_time_ago = ago(
+                    seconds=chain.block_confirmations_count
+                    * chain.block_mining_time
+                    * 2,
+                )
 
-            for token in tokens:
-                account_ids = Balance.objects.filter(
-                    Q(value__gte=token.gather_value(project))
-                    | Q(
-                        last_gathered_at__lte=ago(days=project.gather_time),
-                        value__gte=token.minimal_gather_value(project),
-                    ),
-                    last_gathered_at__lte=gather_time_ago,
-                    account__player__project=project,
-                    chain=chain,
-                    token=token,
-                ).values_list("account", flat=True)[:8]
+                for token in tokens:
+                    account_ids = Balance.objects.filter(
+                        Q(value__gte=token.gather_value(project))
+                        | Q(
+                            last_gathered_at__lte=ago(days=project.gather_time),
+                            value__gte=token.minimal_gather_value(project),
+                        ),
+                        last_gathered_at__lte=gather_time_ago,
+                        account__player__project=project,
+                        chain=chain,
+                        token=token,
+                    ).values_list("account", flat=True)[:8]
 
-                accounts = Account.objects.filter(id__in=account_ids)
+                    accounts = Account.objects.filter(id__in=account_ids)
 
-                for account in accounts:
-                    account.gather(chain, token)
+                    for account in accounts:
+                        account.gather(chain, token)
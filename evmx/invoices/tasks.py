@@ -1,6 +1,8 @@
 from celery import shared_task
 from django.utils import timezone
 
+from chains.utils.ratelimit import RPCPriority
+from chains.utils.ratelimit import rpc_priority
 from common.decorators import singleton_task
 from invoices.models import Invoice
 from invoices.models import InvoiceType
@@ -9,10 +11,11 @@ from invoices.models import InvoiceType
 @shared_task(ignore_result=True)
 @singleton_task(timeout=16)
 def gather_invoices():
-    for invoice in Invoice.objects.filter(
-        type=InvoiceType.Contract,
-        paid=True,
-        transaction_queue__isnull=True,
-        expired_time__lt=timezone.now(),
-    ):
-        invoice.gather()
+    with rpc_priority(RPCPriority.Low):
+        for invoice in Invoice.objects.filter(
+            type=InvoiceType.Contract,
+            paid=True,
+            transaction_queue__isnull=True,
+            expired_time__lt=timezone.now(),
+        ):
+            invoice.gather()
@@ -37,14 +37,16 @@ class Notification(models.Model):
         verbose_name_plural = verbose_name
 
     def __str__(self):
-        return self.transaction.hash
+        if self.transaction:
+            return self.transaction.hash
+        return self.content.get("hash", "")  # 待打包交易的临时通知,尚无入库的交易
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         assign_perm("view_notification", self.project.owner, self)
 
     def notify(self):
-        project = self.transaction.project
+        project = self.project
         headers = {
             "EVMx-Signature": create_hmac_sign(
                 message_dict=self.content,